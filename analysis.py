@@ -0,0 +1,170 @@
+import concurrent.futures as cf
+import os.path
+import re
+import struct
+import threading
+
+import library
+import shell as sh
+import wad
+
+COMPLEVEL_CACHE_FILE = library.CACHE_DIR + "/complevels.json"
+
+# feature levels of a single file, ordered by what they demand from the engine
+VANILLA = 0
+BOOM = 1
+MBF = 2
+UNSUPPORTED = 3
+# the verdict for a file that couldn't be read
+NO_VERDICT = {"level": None, "episodic": None}
+
+LINEDEF = struct.Struct("<hhhhhhh")
+SECTOR = struct.Struct("<hh8s8shhh")
+VANILLA_MAX_LINE_SPECIAL = 141
+VANILLA_MAX_SECTOR_SPECIAL = 17
+
+BOOM_LUMPS = ("SWITCHES", "ANIMATED", "TRANMAP", "UMAPINFO")
+MBF_LUMPS = ("OPTIONS",)
+# lumps of ports PrBoom+ doesn't support, the complevel is best left to the user
+UNSUPPORTED_LUMPS = ("BEHAVIOR", "TEXTMAP", "DECORATE", "ZSCRIPT", "ZMAPINFO")
+
+BEX_SECTION = re.compile(r"^\s*\[(CODEPTR|STRINGS|PARS|SPRITES|SOUNDS|MUSIC|HELPER)\]", re.I | re.M)
+BEX_CODEPOINTER = re.compile(r"^\s*FRAME\s+\d+\s*=\s*(?:A_)?(\w+)", re.I | re.M)
+MBF_CODEPOINTERS = (
+    "DETONATE", "MUSHROOM", "SPAWN", "TURN", "FACE", "SCRATCH", "PLAYSOUND",
+    "RANDOMJUMP", "LINEEFFECT", "DIE", "FIREOLDBFG", "BETASKULLATTACK", "STOP"
+)
+MBF_THING_FLAGS = re.compile(r"\b(TOUCHY|BOUNCES|FRIEND|FLOATBOB|OVERUNDER)\b", re.I)
+
+
+def dehacked_level(text: str) -> int:
+    """Tell a vanilla DEHACKED patch from a BOOM/MBF extended one"""
+    sections = [section.upper() for section in BEX_SECTION.findall(text)]
+    pointers = [pointer.upper() for pointer in BEX_CODEPOINTER.findall(text)]
+    if "HELPER" in sections or MBF_THING_FLAGS.search(text) or any(p in MBF_CODEPOINTERS for p in pointers):
+        return MBF
+    return BOOM if bool(sections) else VANILLA
+
+
+def map_level(wadfile: wad.WadFile) -> int:
+    """Look for BOOM line and sector specials in the binary maps of a WAD"""
+    for lump in wadfile.lumps:
+        if lump.name == "LINEDEFS":
+            data = wadfile.read(lump)
+            usable = len(data) - len(data) % LINEDEF.size
+            if any(line[3] > VANILLA_MAX_LINE_SPECIAL or line[3] < 0
+                   for line in LINEDEF.iter_unpack(data[:usable])):
+                return BOOM
+        elif lump.name == "SECTORS":
+            data = wadfile.read(lump)
+            usable = len(data) - len(data) % SECTOR.size
+            if any(sector[5] > VANILLA_MAX_SECTOR_SPECIAL or sector[5] < 0
+                   for sector in SECTOR.iter_unpack(data[:usable])):
+                return BOOM
+    return VANILLA
+
+
+def analyze_file(path: str) -> dict:
+    """Detect the feature level of a WAD or a DEHACKED patch and whether its maps are episodic.
+    Runs in worker processes, so it must only return plain data"""
+    if not wad.is_wad_name(path):
+        with open(path, "rb") as patch:
+            text = patch.read().decode("latin-1")
+        return {"level": dehacked_level(text), "episodic": None}
+    with wad.WadFile(path) as wadfile:
+        names = set(lump.name for lump in wadfile.lumps)
+        maps = wadfile.maps()
+        episodic = any(wad.EPISODE_MAP.match(name) for name in maps) if bool(maps) else None
+        if bool(names.intersection(UNSUPPORTED_LUMPS)):
+            level = UNSUPPORTED
+        elif bool(names.intersection(MBF_LUMPS)):
+            level = MBF
+        else:
+            level = BOOM if bool(names.intersection(BOOM_LUMPS)) else VANILLA
+            if "DEHACKED" in names:
+                level = max(level, dehacked_level(wadfile.read(wadfile.find("DEHACKED")).decode("latin-1")))
+            if level == VANILLA:
+                level = map_level(wadfile)
+    return {"level": level, "episodic": episodic}
+
+
+def suggest_comp_index(verdicts: list, iwad_name: str) -> int:
+    """Combine the verdicts of all the files in a load order into an index of compat_list"""
+    level = max((verdict["level"] for verdict in verdicts if verdict["level"] is not None), default=VANILLA)
+    if level == UNSUPPORTED:
+        return 5
+    elif level == MBF:
+        return 4
+    elif level == BOOM:
+        return 3
+    elif iwad_name in ("PLUTONIA.WAD", "TNT.WAD"):
+        return 2
+    elif iwad_name in sh.iwads_with_episodes or any(verdict["episodic"] for verdict in verdicts):
+        return 1
+    return 0
+
+
+class ComplevelAnalyzer(object):
+    """Analyze files in a process pool in the background, the verdicts are kept in a
+    persistent cache so that every file is only analyzed once per change"""
+
+    def __init__(self, cache_file=COMPLEVEL_CACHE_FILE, workers=None):
+        self.cache = library.FileCache(cache_file)
+        self.__workers = workers
+        self.__executor = None
+        self.__pending = {}
+        self.__lock = threading.Lock()
+
+    def verdict(self, path: str):
+        """Return the cached verdict for a file, or None if it's not analyzed yet"""
+        try:
+            return self.cache.lookup(path)
+        except OSError:
+            return None
+
+    def submit(self, paths: list):
+        """Queue up analysis of the files that have no up to date verdict"""
+        for path in paths:
+            key = os.path.abspath(path)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            with self.__lock:
+                if key in self.__pending or self.cache.lookup(path, stat) is not None:
+                    continue
+                if self.__executor is None:
+                    self.__executor = cf.ProcessPoolExecutor(max_workers=self.__workers)
+                future = self.__executor.submit(analyze_file, path)
+                self.__pending[key] = future
+            future.add_done_callback(lambda done, p=path, s=stat: self.__store(p, s, done))
+
+    def __store(self, path: str, stat, future: cf.Future):
+        if not future.cancelled():
+            # a file that can't be analyzed gets a verdict too, so it isn't submitted over and over
+            self.cache.store(path, future.result() if future.exception() is None else NO_VERDICT, stat)
+        with self.__lock:
+            self.__pending.pop(os.path.abspath(path), None)
+            finished = not bool(self.__pending)
+        if finished:
+            self.cache.save()
+
+    def busy(self) -> bool:
+        with self.__lock:
+            return bool(self.__pending)
+
+    def pending(self, path: str) -> bool:
+        with self.__lock:
+            return os.path.abspath(path) in self.__pending
+
+    def shutdown(self):
+        with self.__lock:
+            for future in self.__pending.values():
+                future.cancel()
+            executor, self.__executor = self.__executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+        self.cache.save()
+
+
+complevels = ComplevelAnalyzer()
@@ -0,0 +1,127 @@
+import os
+import os.path
+import re
+import threading
+import zipfile
+
+import library
+
+ARCHIVE_CACHE_FILE = library.CACHE_DIR + "/archives.json"
+EXTRACT_DIR = library.CACHE_DIR + "/extracted"
+ARCHIVE_PATTERNS = ("*.zip", "*.pk3", "*.ZIP", "*.PK3")
+MEMBER_EXTENSIONS = (".wad", ".deh", ".bex")
+# members are listed as "archive.zip/folder/MEMBER.WAD"
+MEMBER_PATH = re.compile(r"^(.*?\.(?:zip|pk3))/(.+)$", re.I)
+MB = 1 << 20
+
+
+def is_archive_name(name: str) -> bool:
+    return os.path.splitext(name)[1].lower() in (".zip", ".pk3")
+
+
+def split_member(path: str):
+    """Return (archive path, member name) for a file inside an archive, None for a plain file"""
+    found = MEMBER_PATH.match(path)
+    return (found.group(1), found.group(2)) if found is not None else None
+
+
+def read_members(path: str) -> list:
+    """List [name, size, crc] of the WADs and patches in the archive, only the central directory is read"""
+    with zipfile.ZipFile(path) as archive:
+        return [
+            [info.filename, info.file_size, info.CRC] for info in archive.infolist()
+            if os.path.splitext(info.filename)[1].lower() in MEMBER_EXTENSIONS
+        ]
+
+
+class ArchiveCache(object):
+    """The WADs and patches inside .zip and .pk3 archives. Listing an archive only reads its
+    central directory and is cached on (size, mtime). Members are extracted when a game starts,
+    into a folder named after their contents, and the least recently used ones are deleted
+    once the folder grows past its size budget"""
+
+    def __init__(self, cache_file=ARCHIVE_CACHE_FILE, folder=EXTRACT_DIR):
+        self.cache = library.FileCache(cache_file)
+        self.__folder = folder
+        self.__lock = threading.Lock()
+
+    def members(self, path: str) -> list:
+        """Return [name, size, crc] of the usable members, nothing for a broken archive"""
+        try:
+            return self.cache.get(path, read_members)
+        except (OSError, zipfile.BadZipFile):
+            return []
+
+    def expand(self, root: str, files: list) -> list:
+        """Replace the archives among the files found in root by their members"""
+        expanded = []
+        for file in files:
+            if is_archive_name(file):
+                expanded.extend("{}/{}".format(file, member[0]) for member in self.members(os.path.join(root, file)))
+            else:
+                expanded.append(file)
+        self.cache.save()
+        return expanded
+
+    def __member_file(self, member: list) -> str:
+        name, size, crc = member
+        return "{}/{:08x}-{}-{}".format(self.__folder, crc, size, os.path.basename(name))
+
+    def extract(self, path: str) -> str:
+        """Return a file the engine can load for the archive member, or the path unchanged for a plain file"""
+        split = split_member(path)
+        if split is None:
+            return path
+        archive, name = split
+        found = [member for member in self.members(archive) if member[0] == name]
+        if not bool(found):
+            raise FileNotFoundError("No {} in {}".format(name, archive))
+        extracted = self.__member_file(found[0])
+        if library.read_only:
+            # the file it would be extracted to, the command line is only shown
+            return extracted
+        with self.__lock:
+            if os.path.exists(extracted):
+                # the modification time is the last use for the eviction
+                os.utime(extracted)
+            else:
+                if not os.path.exists(self.__folder):
+                    os.makedirs(self.__folder)
+                try:
+                    with zipfile.ZipFile(archive) as source, open(extracted + ".tmp", "wb") as target:
+                        with source.open(name) as member:
+                            for chunk in iter(lambda: member.read(MB), b""):
+                                target.write(chunk)
+                except zipfile.BadZipFile as error:
+                    raise OSError("Broken archive {}: {}".format(archive, error))
+                os.replace(extracted + ".tmp", extracted)
+        self.cache.save()
+        return extracted
+
+    def extract_all(self, paths: list, budget_mb: int) -> list:
+        """Extract the members among the paths, then evict old members that aren't among them"""
+        extracted = [self.extract(path) for path in paths]
+        self.evict(budget_mb * MB, keep=set(os.path.abspath(path) for path in extracted))
+        return extracted
+
+    def evict(self, budget: int, keep=()):
+        """Delete the least recently used members until the folder fits in the budget"""
+        with self.__lock:
+            if library.read_only or not os.path.isdir(self.__folder):
+                return
+            with os.scandir(self.__folder) as entries:
+                files = [(entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in entries]
+            total = sum(size for mtime, size, path in files)
+            for mtime, size, path in sorted(files):
+                if total <= budget:
+                    break
+                if os.path.abspath(path) in keep:
+                    continue
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    continue
+
+
+cache = ArchiveCache()
@@ -0,0 +1,101 @@
+import argparse
+import collections
+import concurrent.futures as cf
+import csv
+import json
+import re
+import subprocess
+
+import shell as sh
+
+TIMEDEMO_RESULT = re.compile(
+    r"Timed\s+(\d+)\s+gametics\s+in\s+(\d+)\s+realtics(?:\s*=\s*([\d.]+)\s+frames\s+per\s+second)?", re.I
+)
+REPORT_FIELDS = ("demo", "iwad", "files", "gametics", "realtics", "fps", "exit_code", "error")
+
+BenchmarkJob = collections.namedtuple("BenchmarkJob", ("iwad", "files", "demo", "comp_index"))
+
+
+def parse_timedemo(output: str):
+    """Return (gametics, realtics, fps) from the engine output, or None if it didn't report them"""
+    found = TIMEDEMO_RESULT.findall(output)
+    if not bool(found):
+        return None
+    gametics, realtics, fps = found[-1]
+    gametics, realtics = int(gametics), int(realtics)
+    if bool(fps):
+        return gametics, realtics, float(fps)
+    return gametics, realtics, round(gametics * 35 / realtics, 1) if bool(realtics) else 0.0
+
+
+def load_jobs(jobs_file: str) -> list:
+    with open(jobs_file) as source:
+        specs = json.load(source)
+    return [
+        BenchmarkJob(spec["iwad"], spec.get("files", []), spec["demo"], spec.get("comp_index", 5))
+        for spec in specs
+    ]
+
+
+def run_job(job: BenchmarkJob, timeout=None) -> dict:
+    result = {field: None for field in REPORT_FIELDS}
+    result.update(demo=job.demo, iwad=job.iwad, files=';'.join(job.files), error="")
+    try:
+        session = sh.TimedemoSession(sh.iwad_list.index(job.iwad), job.comp_index, job.files, "", job.demo)
+    except ValueError:
+        result["error"] = "Unknown IWAD"
+        return result
+    current = session.launch(stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    if current is None:
+        result["error"] = "; ".join(str(problem) for problem in session.problems) or "Executable not found"
+        return result
+    try:
+        output, _ = current.process.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        current.process.kill()
+        output, _ = current.process.communicate()
+        result["error"] = "Timed out"
+    result["exit_code"] = current.process.returncode
+    timing = parse_timedemo(output or "")
+    if timing is None:
+        result["error"] = result["error"] or "No timedemo result in the output"
+    else:
+        result["gametics"], result["realtics"], result["fps"] = timing
+    return result
+
+
+def run_batch(jobs: list, workers=1, timeout=None) -> list:
+    """Run the jobs with at most `workers` engine processes at a time, results keep the order of jobs"""
+    with cf.ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        return list(pool.map(lambda job: run_job(job, timeout), jobs))
+
+
+def write_report(results: list, report_file: str):
+    if report_file.lower().endswith(".json"):
+        with open(report_file, "w") as report:
+            json.dump(results, report, indent=2)
+    else:
+        with open(report_file, "w", newline="") as report:
+            writer = csv.DictWriter(report, fieldnames=REPORT_FIELDS)
+            writer.writeheader()
+            writer.writerows(results)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run PrBoom+ -timedemo benchmarks in batch")
+    parser.add_argument("jobs", help="JSON file with the list of benchmark jobs")
+    parser.add_argument("--workers", type=int, default=1, help="number of engine processes to run at once")
+    parser.add_argument("--timeout", type=float, default=None, help="seconds to wait for every demo")
+    parser.add_argument("--report", default="benchmark.csv", help="report file, .csv or .json")
+    parser.add_argument("--preset", default=None, help="launcher .ini file with the global settings")
+    args = parser.parse_args(argv)
+    if bool(args.preset):
+        sh.IniManager(sh.ShellCustom()).load(args.preset)
+    results = run_batch(load_jobs(args.jobs), args.workers, args.timeout)
+    write_report(results, args.report)
+    for result in results:
+        print("{demo}: {fps} fps {error}".format(**result))
+
+
+if __name__ == '__main__':
+    main()
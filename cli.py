@@ -0,0 +1,144 @@
+import argparse
+
+import library
+import sampler
+import shell as sh
+import tracing
+
+
+def level_index(game: str, warp: list) -> int:
+    """Convert -warp style numbers into the level index used by the game managers"""
+    if len(warp) > 1:
+        return (warp[0] - 1) * 9 + warp[1]
+    if game == sh.NRFTL or game == sh.MASTER:
+        # these lists have no "main menu" entry
+        return warp[0] - 1
+    return warp[0]
+
+
+def levels(gamemgr: sh.Shell, game) -> tuple:
+    """The levels the game can warp to, the custom game's depend on its IWAD"""
+    if game is not None:
+        return sh.level_lists[game]
+    episodic = sh.iwad_list[gamemgr.iwad_index] in sh.iwads_with_episodes
+    return sh.ultimate_levels if episodic else sh.doom2_levels
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m cli", description="Start PrBoom+ from a launcher preset without the GUI"
+    )
+    parser.add_argument("--preset", default=None, help="preset .ini file, the launcher's last state by default")
+    parser.add_argument("--preset-name", default=None, help="preset from the preset library, loaded over --preset")
+    parser.add_argument(
+        "--list-presets", nargs='?', const="", default=None, metavar="PREFIX",
+        help="list the presets in the library whose names start with the prefix"
+    )
+    parser.add_argument(
+        "--game", choices=list(sh.games), default=None,
+        help="start an official release instead of the preset's custom game"
+    )
+    parser.add_argument("--warp", type=int, nargs='+', default=None, metavar="N", help="map number, or episode and map")
+    parser.add_argument("--skill", type=int, choices=range(1, len(sh.skill_list) + 1), default=None)
+    parser.add_argument(
+        "--dry-run", action="store_true", help="print the command line without starting the engine or writing anything"
+    )
+    parser.add_argument("--wait", action="store_true", help="wait for the engine and return its exit code")
+    parser.add_argument(
+        "--sample-usage", action="store_true",
+        help="record the engine's CPU, memory and I/O use in inis/sessions.jsonl, waits for it to exit"
+    )
+    parser.add_argument("--recent", action="store_true", help="list the recently started sessions, newest first")
+    parser.add_argument(
+        "--relaunch", type=int, nargs='?', const=1, default=None, metavar="N",
+        help="start the Nth recent session again, the last one by default"
+    )
+    parser.add_argument("--trace", default=None, metavar="FILE", help="write a Chrome trace of the launch to the file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.trace is not None:
+        tracing.tracer.enable(args.trace)
+    # nothing is written for a dry run, not even the caches
+    library.read_only = args.dry_run
+    sh.remove_stale_response_files()
+    custommgr = sh.ShellCustom()
+    inimgr = sh.IniManager(custommgr)
+    inimgr.load(args.preset)
+    if args.recent:
+        import recent
+        for number, entry in enumerate(recent.journal.entries(), 1):
+            print("{}\t{}".format(number, entry["title"]))
+        return 0
+    if args.relaunch is not None:
+        return relaunch(args)
+    if args.preset_name is not None or args.list_presets is not None:
+        # sqlite is only loaded when the preset library is used, it's not needed for plain launches
+        import presets
+        store = presets.PresetStore(inimgr)
+        if args.list_presets is not None:
+            for name, iwad, last_used in store.search(args.list_presets):
+                print("{}\t{}".format(name, iwad))
+            return 0
+        if not store.load(args.preset_name):
+            print("No preset named {}".format(args.preset_name))
+            return 1
+    gamemgr = custommgr
+    if args.game is not None:
+        gamemgr = sh.Shell()
+        gamemgr.game = args.game
+        gamemgr.skill_index = custommgr.skill_index
+        gamemgr.level_index = 0
+    if args.sample_usage:
+        sh.Shell.sample_usage = True
+    if args.skill is not None:
+        gamemgr.skill_index = args.skill - 1
+    if args.warp is not None:
+        index = level_index(args.game, args.warp)
+        if not 0 <= index < len(levels(gamemgr, args.game)):
+            print("No such map: {}".format(' '.join(str(number) for number in args.warp)))
+            return 1
+        gamemgr.level_index = index
+    if args.dry_run:
+        gamemgr.start_game(sh.DryRunManager())
+        return 0
+    # the engine keeps writing to the terminal, the output log is for the GUI
+    current = gamemgr.start_game(sh.ProcessManager())
+    if current is None:
+        return 1
+    return finish(args, current)
+
+
+def finish(args, current: sh.SessionProcess) -> int:
+    """Wait for the engine if asked to, or while its usage is sampled: the sampler
+    runs on a daemon thread and would be gone with the CLI before it writes the record"""
+    sampled = sh.Shell.sample_usage and sampler.available()
+    if not args.wait and not sampled:
+        return 0
+    exit_code = current.process.wait()
+    sampler.join_all()
+    return exit_code if args.wait else 0
+
+
+def relaunch(args) -> int:
+    # the recent sessions are only loaded when they're asked for
+    import recent
+    entries = recent.journal.entries()
+    if not 0 < args.relaunch <= len(entries):
+        print("No recent session number {}".format(args.relaunch))
+        return 1
+    if args.sample_usage:
+        sh.Shell.sample_usage = True
+    if args.dry_run:
+        sh.relaunch(entries[args.relaunch - 1], sh.DryRunManager())
+        return 0
+    current = sh.relaunch(entries[args.relaunch - 1], sh.ProcessManager())[0]
+    if current is None:
+        return 1
+    return finish(args, current)
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,92 @@
+import collections
+import os.path
+
+import library
+import wad
+
+DIRECTORY_CACHE_FILE = library.CACHE_DIR + "/directories.json"
+# lumps between these markers are looked up apart from the others, a flat and a patch can share a name
+NAMESPACES = {"S_START": "sprite", "SS_START": "sprite", "F_START": "flat", "FF_START": "flat"}
+NAMESPACE_ENDS = ("S_END", "SS_END", "F_END", "FF_END")
+MAP_LUMPS = frozenset((
+    "THINGS", "LINEDEFS", "SIDEDEFS", "VERTEXES", "SEGS", "SSECTORS", "NODES", "SECTORS", "REJECT",
+    "BLOCKMAP", "BEHAVIOR", "SCRIPTS", "TEXTMAP", "ZNODES", "DIALOGUE", "ENDMAP"
+))
+# the engine applies every one of these in load order instead of only the last
+MERGED_LUMPS = ("DEHACKED",)
+KIND_ORDER = ("map", "lump", "flat", "sprite")
+
+
+class Conflict(collections.namedtuple("Conflict", ("kind", "name", "files"))):
+    """A lump defined by several files of the load order, files are in load order so the last one wins"""
+
+    @property
+    def winner(self) -> str:
+        return self.files[-1]
+
+    def __str__(self) -> str:
+        names = [os.path.basename(file) for file in self.files]
+        if self.name in MERGED_LUMPS:
+            return "{}: {} (all applied)".format(self.name, ", ".join(names))
+        return "{}: {} over {}".format(self.name, names[-1], ", ".join(names[:-1]))
+
+
+def read_directory(path: str) -> list:
+    """[name, size, offset] of every lump, only the header and the directory are read"""
+    with wad.WadFile(path) as wadfile:
+        return [[lump.name, lump.size, lump.offset] for lump in wadfile.lumps]
+
+
+def lump_keys(directory: list) -> list:
+    """Return (kind, name) of what the file defines: maps as a whole, sprites, flats and other lumps.
+    A map is its marker, the lumps after it belong to it and aren't listed"""
+    names = [entry[0] for entry in directory]
+    keys = collections.OrderedDict()
+    namespace = "lump"
+    in_map = False
+    for i, name in enumerate(names):
+        if in_map and (name in MAP_LUMPS or name.startswith("GL_")):
+            continue
+        in_map = False
+        if name in NAMESPACES:
+            namespace = NAMESPACES[name]
+        elif name in NAMESPACE_ENDS:
+            namespace = "lump"
+        elif i + 1 < len(names) and names[i + 1] in wad.MAP_DATA_LUMPS:
+            in_map = True
+            keys[("map", name)] = None
+        elif not name.endswith("_START") and not name.endswith("_END"):
+            keys[(namespace, name)] = None
+    return list(keys)
+
+
+class ConflictAnalyzer(object):
+    """Find the lumps that several files of a load order define, by joining the lump names of
+    their directories. The directories are cached on (size, mtime), so a new selection only
+    reads the files that weren't looked at before"""
+
+    def __init__(self, cache_file=DIRECTORY_CACHE_FILE):
+        self.cache = library.FileCache(cache_file)
+
+    def directory(self, path: str):
+        """Return the lump directory of the file, None if it can't be read"""
+        try:
+            return self.cache.get(path, read_directory)
+        except (OSError, ValueError):
+            return None
+
+    def analyze(self, paths: list) -> list:
+        """Return a Conflict for every lump more than one of the files defines, maps first"""
+        owners = collections.OrderedDict()
+        for path in paths:
+            directory = self.directory(path)
+            if directory is None:
+                continue
+            for key in lump_keys(directory):
+                owners.setdefault(key, []).append(path)
+        self.cache.save()
+        conflicts = [Conflict(kind, name, files) for (kind, name), files in owners.items() if len(files) > 1]
+        return sorted(conflicts, key=lambda conflict: (KIND_ORDER.index(conflict.kind), conflict.name))
+
+
+analyzer = ConflictAnalyzer()
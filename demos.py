@@ -0,0 +1,121 @@
+import collections
+import os.path
+
+import library
+import shell as sh
+
+DEMO_CACHE_FILE = library.CACHE_DIR + "/demos.json"
+DEMO_PATTERNS = ("*.lmp", "*.LMP")
+TICRATE = 35
+
+# the largest header we have to read: Boom 2.00 demos pad their options block to 256 bytes
+HEADER_READ_SIZE = 320
+BOOM_OPTIONS_SIZE = 64
+BOOM_200_OPTIONS_SIZE = 256
+BOOM_MAXPLAYERS = 32
+VANILLA_LONGTICS = 111
+
+# demo version byte: (description, index of compat_list to use for playback). A vanilla header doesn't
+# tell Doom II from Ultimate or Final Doom, which need other complevels, so PrBoom+ is left to detect it
+demo_versions = {
+    104: ("Doom 1.4", 5), 105: ("Doom 1.5", 5), 106: ("Doom 1.666", 5), 107: ("Doom 1.7", 5),
+    108: ("Doom 1.8", 5), 109: ("Doom 1.9", 5), VANILLA_LONGTICS: ("Doom 1.9 longtics", 5),
+    200: ("Boom 2.00", 3), 201: ("Boom 2.01", 3), 202: ("Boom 2.02", 3), 203: ("MBF", 4),
+    210: ("PrBoom 2.1", 5), 211: ("PrBoom 2.2", 5), 212: ("PrBoom 2.3", 5),
+    213: ("PrBoom 2.4", 5), 214: ("PrBoom+", 5)
+}
+
+FileStat = collections.namedtuple("FileStat", ("st_size", "st_mtime_ns"))
+
+
+def parse_header(header: bytes, size: int) -> dict:
+    """Decode a demo header. The tic count is estimated from the file size, so that
+    only the header bytes have to be read"""
+    version = header[0]
+    if version < 100:
+        # Doom 1.2 and earlier: the first byte is the skill level
+        skill, episode, level = header[0], header[1], header[2]
+        players, header_size = header[3:7], 7
+    elif version < 200:
+        skill, episode, level = header[1], header[2], header[3]
+        players, header_size = header[9:13], 13
+    else:
+        # version, 6 byte signature, compatibility flag, then the same fields as vanilla has
+        skill, episode, level = header[8], header[9], header[10]
+        options = BOOM_200_OPTIONS_SIZE if version == 200 else BOOM_OPTIONS_SIZE
+        header_size = 13 + options + BOOM_MAXPLAYERS
+        players = header[header_size - BOOM_MAXPLAYERS:header_size]
+    player_count = sum(1 for player in players if player)
+    tic_size = 5 if version == VANILLA_LONGTICS else 4
+    tics = max(size - header_size - 1, 0) // (tic_size * max(player_count, 1))
+    description, comp_index = demo_versions.get(version, ("Doom 1.2", 5) if version < 100 else ("Unknown", 5))
+    return {
+        "version": version, "engine": description, "comp_index": comp_index, "skill": skill,
+        "episode": episode, "map": level, "players": player_count, "tics": tics
+    }
+
+
+def read_header(path: str) -> dict:
+    with open(path, "rb") as demo:
+        header = demo.read(HEADER_READ_SIZE)
+    if len(header) < 13:
+        raise ValueError("Not a demo file: {}".format(path))
+    return parse_header(header, os.path.getsize(path))
+
+
+def map_name(info: dict) -> str:
+    if info["episode"] > 1 or info["version"] < 100:
+        return "E{}M{}".format(info["episode"], info["map"])
+    elif info["map"] > 9:
+        return "MAP{:02}".format(info["map"])
+    # episode 1 is recorded for DOOM2 maps too, so these can't be told apart
+    return "E1M{0}/MAP{0:02}".format(info["map"])
+
+
+def play_time(info: dict) -> str:
+    seconds = info["tics"] // TICRATE
+    return "{}:{:02}".format(seconds // 60, seconds % 60)
+
+
+def suggest_iwad_index(info: dict, iwad_index: int) -> int:
+    """Guess the IWAD from the demo's map number, keeping the current one if it fits"""
+    episodic = sh.iwad_list[iwad_index] in sh.iwads_with_episodes
+    if info["episode"] > 1 and not episodic:
+        return sh.iwad_list.index("DOOM.WAD")
+    if info["map"] > 9 and episodic:
+        return sh.iwad_list.index("DOOM2.WAD")
+    return iwad_index
+
+
+class DemoIndex(object):
+    """Metadata of every demo in a folder, read from the demo headers and cached
+    on (size, mtime), so that only new or changed demos are opened"""
+
+    def __init__(self, cache_file=DEMO_CACHE_FILE):
+        self.cache = library.FileCache(cache_file)
+
+    def demos(self, path: str) -> list:
+        """Return (name, info) pairs sorted by name, info is None for unreadable demos"""
+        entries = library.index.entries(path)
+        result = []
+        for name in sorted(library.match_patterns(list(entries), DEMO_PATTERNS), key=lambda n: n.lower()):
+            demo = "{}/{}".format(path, name)
+            result.append((name, self.info(demo, FileStat(entries[name][0], entries[name][1]))))
+        library.index.save()
+        self.cache.save()
+        return result
+
+    def info(self, demo: str, stat=None):
+        """Return the header info of one demo, None if it's unreadable"""
+        try:
+            stat = os.stat(demo) if stat is None else stat
+            info = self.cache.lookup(demo, stat)
+            if info is None:
+                info = read_header(demo)
+                self.cache.store(demo, info, stat)
+        except (OSError, ValueError, IndexError):
+            info = None
+        return info
+
+
+index = DemoIndex()
@@ -1,10 +1,31 @@
 import tkinter as tk
 from tkinter import ttk
 from tkinter import filedialog as fd
-import fnmatch as fn
+from tkinter import messagebox
+import analysis
+import archives
+import conflicts
+import demos
+import inference
+import iwads
+import library
+import presets
+import recent
+import sampler
+import search
+import tracing
 import shell as sh
+import validation
+import wad
+import watcher
 from shell import Shell, ShellCustom
+import collections
+import heapq
+import multiprocessing
 import os, os.path, sys
+import queue
+import threading
+import time
 
 
 help_msg = '''- If a custom wad you're going to play is designed for the original MS-DOS Doom.exe \
@@ -16,6 +37,55 @@ help_msg = '''- If a custom wad you're going to play is designed for the origina
  \n\n- "Don't set -complevel" option is useful when you're going to watch a demo and you want PrBoom+ to auto detect \
 the correct compatibility option for it.'''
 
+# parts of the launcher state, GUI components are refreshed only when the state they show changes
+STATE_GLOBALS = "globals"
+STATE_PATHS = "paths"
+STATE_CUSTOM = "custom"
+ALL_STATES = (STATE_GLOBALS, STATE_PATHS, STATE_CUSTOM)
+
+SESSION_POLL_MS = 500
+AUTOSAVE_DELAY_MS = 1000
+COMPLEVEL_POLL_MS = 250
+FILE_SCAN_POLL_MS = 100
+LIBRARY_PATTERNS = library.PWAD_PATTERNS + archives.ARCHIVE_PATTERNS
+WATCH_POLL_MS = 250
+LOG_POLL_MS = 200
+RELEASE_CHECK_POLL_MS = 100
+MISSING_COLOR = "grey"
+
+
+class Autosave(object):
+    """Coalesce bursts of setting changes into a single journal write once the GUI has been
+    idle for a moment, so that a crash or a kill doesn't lose them"""
+
+    def __init__(self, delay=AUTOSAVE_DELAY_MS):
+        self.__delay = delay
+        self.__widget = None
+        self.__ini_mgr = None
+        self.__job = None
+
+    def attach(self, widget: tk.Misc, inimgr: sh.IniManager):
+        self.__widget = widget
+        self.__ini_mgr = inimgr
+
+    def watch(self, *variables):
+        for var in variables:
+            var.trace_add("write", self.schedule)
+
+    def schedule(self, *args):
+        if self.__widget is None:
+            return
+        if self.__job is not None:
+            self.__widget.after_cancel(self.__job)
+        self.__job = self.__widget.after(self.__delay, self.__write)
+
+    def __write(self):
+        self.__job = None
+        self.__ini_mgr.autosave()
+
+
+autosave = Autosave()
+
 
 def center(win):
     """Center window"""
@@ -25,7 +95,25 @@ def center(win):
     height = win.winfo_height()
     x = (win.winfo_screenwidth() // 2) - (width // 2)
     y = (win.winfo_screenheight() // 2) - (height // 2)
-    win.geometry('{}x{}+{}+{}'.format(width, height, x, y))
+    # only set the position, so the window can still grow when a lazily built tab is shown
+    win.geometry('+{}+{}'.format(x, y))
+
+
+def report_problems(problems: list):
+    """Show everything that keeps a game from starting in one message"""
+    if bool(problems):
+        messagebox.showerror(title="Can't start the game", message='\n'.join(str(problem) for problem in problems))
+
+
+def start_game(gamemgr: Shell):
+    if gamemgr.start_game() is None:
+        report_problems(gamemgr.problems)
+
+
+def relaunch(entry: dict):
+    current, problems = sh.relaunch(entry)
+    if current is None:
+        report_problems(problems)
 
 
 class MainWindow(tk.Tk):
@@ -35,6 +123,7 @@ class MainWindow(tk.Tk):
         self.__custommgr = ShellCustom()
         self.__ini_mgr = sh.IniManager(self.__custommgr)
         self.__ini_mgr.load()
+        autosave.attach(self, self.__ini_mgr)
         self.__gui = GUI(
             gamemgr=self.__gamemgr, custommgr=self.__custommgr, inimgr=self.__ini_mgr, master=self
         )
@@ -43,6 +132,7 @@ class MainWindow(tk.Tk):
 
     def __quit(self, *args):
         self.__ini_mgr.save()
+        analysis.complevels.shutdown()
         self.destroy()
 
 
@@ -88,6 +178,7 @@ class GUIPopupExeSet(GUIPopup):
     def __accept(self):
         Shell.prboom = self.__prboom.get()
         Shell.glboom = self.__glboom.get()
+        autosave.schedule()
         self._close()
 
 
@@ -109,6 +200,7 @@ class GUIPopupScreenSet(GUIPopup):
         except tk._tkinter.TclError as err:
             self.__warning.set("Invalid resolution value!")
             return
+        autosave.schedule()
         self._close()
 
     def __deploy_widgets(self):
@@ -123,6 +215,199 @@ class GUIPopupScreenSet(GUIPopup):
         self._popup_frame.pack()
 
 
+class GUIPopupDemoList(GUIPopup):
+    """List the demos in the demo folder along with the metadata from their headers"""
+
+    def __init__(self, parent, on_select):
+        super().__init__(parent)
+        self.__on_select = on_select
+        self.__demos = demos.index.demos(Shell.demopath)
+        self.__list = tk.Listbox(
+            master=self._popup_frame, selectmode=tk.SINGLE, exportselection=0,
+            height=18, width=72, font="TkFixedFont"
+        )
+        self.__scroll = tk.Scrollbar(master=self._popup_frame, command=self.__list.yview, orient=tk.VERTICAL)
+        self.__button_panel = tk.Frame(master=self._popup_frame)
+        self.__watch = watcher.folders.watch(Shell.demopath, demos.DEMO_PATTERNS)
+        self.__poll = self.after(WATCH_POLL_MS, self.__poll_watch)
+        self.bind("<Destroy>", self.__unwatch)
+        self.__deploy_widgets()
+        center(self)
+
+    def __deploy_widgets(self):
+        self.__fill()
+        self.__list.configure(yscrollcommand=self.__scroll.set)
+        self.__list.bind("<Double-Button-1>", lambda evt: self.__accept())
+        self.__list.grid(row=0, column=0)
+        self.__scroll.grid(row=0, column=1, sticky=tk.N + tk.S)
+        tk.Button(self.__button_panel, text="Select", command=self.__accept).grid(column=0, row=0, padx=10)
+        tk.Button(self.__button_panel, text="Browse...", command=self.__browse).grid(column=1, row=0, padx=10)
+        tk.Button(self.__button_panel, text="Quit", command=self._close).grid(column=2, row=0, padx=10)
+        self.__button_panel.grid(row=1, column=0, columnspan=2, pady=4)
+        self._popup_frame.pack()
+
+    def __fill(self, selected=None):
+        self.__list.delete(0, tk.END)
+        for i, (name, info) in enumerate(self.__demos):
+            self.__list.insert(tk.END, self.__describe(name, info))
+            if name == selected:
+                self.__list.select_set(i)
+
+    def __poll_watch(self):
+        changes = self.__watch.changes()
+        if bool(changes):
+            self.__apply_changes(changes)
+        self.__poll = self.after(WATCH_POLL_MS, self.__poll_watch)
+
+    def __apply_changes(self, changes: list):
+        """Update the rows of the demos that were added, removed or renamed while the list is open"""
+        selection = self.__list.curselection()
+        selected = self.__demos[selection[0]][0] if bool(selection) else None
+        demo_list = collections.OrderedDict(self.__demos)
+        for change in changes:
+            if change.kind == watcher.RESCAN:
+                demo_list = collections.OrderedDict(demos.index.demos(Shell.demopath))
+                continue
+            if change.kind in (watcher.REMOVED, watcher.RENAMED):
+                demo_list.pop(change.name, None)
+            if change.kind in (watcher.ADDED, watcher.CHANGED):
+                demo_list[change.name] = demos.index.info("{}/{}".format(Shell.demopath, change.name))
+            elif change.kind == watcher.RENAMED:
+                demo_list[change.new_name] = demos.index.info("{}/{}".format(Shell.demopath, change.new_name))
+        demos.index.cache.save()
+        self.__demos = sorted(demo_list.items(), key=lambda demo: demo[0].lower())
+        self.__fill(selected)
+
+    def __unwatch(self, evt):
+        if evt.widget is self:
+            self.after_cancel(self.__poll)
+            watcher.folders.unwatch(self.__watch)
+
+    @staticmethod
+    def __describe(name: str, info):
+        if info is None:
+            return "{:<24} (unreadable)".format(name[:24])
+        return "{:<24} {:<18} {:<10} skill {} {}P {:>7}".format(
+            name[:24], info["engine"], demos.map_name(info), info["skill"] + 1, info["players"], demos.play_time(info)
+        )
+
+    def __accept(self):
+        selection = self.__list.curselection()
+        if bool(selection):
+            name, info = self.__demos[selection[0]]
+            self.__on_select("{}/{}".format(Shell.demopath, name), info)
+            self._close()
+
+    def __browse(self):
+        demo = fd.askopenfilename(
+            title="Locate demo to play", initialdir=Shell.demopath,
+            filetypes=[("Demo lumps", "*.lmp"), ("All files", "*.*")]
+        )
+        if bool(demo):
+            try:
+                info = demos.read_header(demo)
+            except (OSError, ValueError, IndexError):
+                info = None
+            self.__on_select(demo, info)
+            self._close()
+
+
+class GUIPopupPresetName(GUIPopup):
+    def __init__(self, parent, on_accept):
+        super().__init__(parent)
+        self.__on_accept = on_accept
+        self.__name = tk.StringVar(self._popup_frame)
+        tk.Label(master=self._popup_frame, text="Preset name:").pack(padx=10)
+        entry = tk.Entry(master=self._popup_frame, textvariable=self.__name, width=30)
+        entry.pack(pady=6, padx=10)
+        entry.bind("<Return>", lambda evt: self.__accept())
+        entry.focus_set()
+        tk.Button(master=self._popup_frame, text="Accept", command=self.__accept).pack(pady=3, padx=10)
+        tk.Button(master=self._popup_frame, text="Quit", command=self._close).pack(pady=3, padx=10)
+        self._popup_frame.pack()
+        center(self)
+
+    def __accept(self):
+        if bool(self.__name.get().strip()):
+            self.__on_accept(self.__name.get().strip())
+            self._close()
+
+
+class GUIPopupPresetLibrary(GUIPopup):
+    """Search the preset library by name and IWAD as you type"""
+
+    ANY_IWAD = "Any IWAD"
+
+    def __init__(self, parent, store: presets.PresetStore, on_load):
+        super().__init__(parent)
+        self.__store = store
+        self.__on_load = on_load
+        self.__found = []
+        self.__search = tk.StringVar(self._popup_frame)
+        self.__iwad = tk.StringVar(self._popup_frame)
+        self.__iwad.set(self.ANY_IWAD)
+        self.__list = tk.Listbox(
+            master=self._popup_frame, selectmode=tk.SINGLE, exportselection=0,
+            height=16, width=64, font="TkFixedFont"
+        )
+        self.__button_panel = tk.Frame(master=self._popup_frame)
+        self.__deploy_widgets()
+        self.__search.trace_add("write", self.__refresh)
+        self.__iwad.trace_add("write", self.__refresh)
+        self.__refresh()
+        center(self)
+
+    def __deploy_widgets(self):
+        tk.Label(master=self._popup_frame, text="Search:").grid(row=0, column=0, sticky=tk.E)
+        entry = tk.Entry(master=self._popup_frame, textvariable=self.__search, width=30)
+        entry.grid(row=0, column=1, sticky=tk.W, pady=4)
+        entry.focus_set()
+        tk.OptionMenu(self._popup_frame, self.__iwad, self.ANY_IWAD, *sh.iwad_list).grid(row=0, column=2)
+        self.__list.grid(row=1, column=0, columnspan=3, padx=5)
+        self.__list.bind("<Double-Button-1>", lambda evt: self.__load())
+        tk.Button(self.__button_panel, text="Load", command=self.__load).grid(column=0, row=0, padx=10)
+        tk.Button(self.__button_panel, text="Export...", command=self.__export).grid(column=1, row=0, padx=10)
+        tk.Button(self.__button_panel, text="Delete", command=self.__delete).grid(column=2, row=0, padx=10)
+        tk.Button(self.__button_panel, text="Quit", command=self._close).grid(column=3, row=0, padx=10)
+        self.__button_panel.grid(row=2, column=0, columnspan=3, pady=4)
+        self._popup_frame.pack()
+
+    def __refresh(self, *args):
+        iwad = None if self.__iwad.get() == self.ANY_IWAD else self.__iwad.get()
+        self.__found = self.__store.search(self.__search.get(), iwad=iwad)
+        self.__list.delete(0, tk.END)
+        for name, iwad, last_used in self.__found:
+            used = time.strftime("%Y-%m-%d %H:%M", time.localtime(last_used)) if bool(last_used) else ""
+            self.__list.insert(tk.END, "{:<32} {:<14} {}".format(name[:32], iwad, used))
+
+    def __selected(self):
+        selection = self.__list.curselection()
+        return self.__found[selection[0]][0] if bool(selection) else None
+
+    def __load(self):
+        name = self.__selected()
+        if name is not None and self.__store.load(name):
+            self.__on_load()
+            self._close()
+
+    def __export(self):
+        name = self.__selected()
+        if name is None:
+            return
+        file = fd.asksaveasfilename(
+            title="Export preset as...", initialdir="./inis", initialfile=name,
+            filetypes=[(".INI config files", "*.ini"), ("All files", "*.*")], defaultextension=".ini"
+        )
+        if bool(file):
+            self.__store.export_ini(name, file)
+
+    def __delete(self):
+        name = self.__selected()
+        if name is not None:
+            self.__store.delete(name)
+            self.__refresh()
+
+
 class GUIOpenGLSet(tk.Frame):
     def __init__(self, master, **kwargs):
         super().__init__(master=master, **kwargs)
@@ -190,10 +475,17 @@ class GUIDropdown(tk.OptionMenu):
         self._gamemgr = gamemgr
         self._var = var
         self._var.trace_add("write", self.pass_var_index)
+        autosave.watch(self._var)
 
     def pass_var_index(self, *a):
         return
 
+    def set_options(self, var_list):
+        menu = self["menu"]
+        menu.delete(0, tk.END)
+        for value in var_list:
+            menu.add_command(label=value, command=tk._setit(self._var, value))
+
 
 class GUIDropdownSkill(GUIDropdown):
     def __init__(self, gamemgr: Shell, master, skill_var, *args):
@@ -274,6 +566,22 @@ class GUIIwadLevelMenus(tk.Frame):
             self.__menu_doom2_maps.grid()
             self.__menu_doom2_maps.pass_var_index()
 
+    def update_map_lists(self, *args):
+        """Offer only the maps defined by the selected PWADs, or every map of the IWAD if they define none"""
+        paths = [sh.pwad_path(file) for file in self.__custommgr.files if wad.is_wad_name(file)]
+        found = wad.pwad_maps(paths)
+        ult_maps = [level for level in sh.ultimate_levels[1:] if level in found]
+        doom2_maps = [level for level in sh.doom2_levels[1:] if level in found]
+        ult_maps = [sh.ultimate_levels[0]] + ult_maps if bool(ult_maps) else sh.ultimate_levels
+        doom2_maps = [sh.doom2_levels[0]] + doom2_maps if bool(doom2_maps) else sh.doom2_levels
+        self.__menu_ult_maps.set_options(ult_maps)
+        self.__menu_doom2_maps.set_options(doom2_maps)
+        # only reset the map of the visible menu, both of them write to the same level_index
+        if self.__ultdoom_maplist.get() and self.__map_ult.get() not in ult_maps:
+            self.__map_ult.set(ult_maps[0])
+        elif not self.__ultdoom_maplist.get() and self.__map_doom2.get() not in doom2_maps:
+            self.__map_doom2.set(doom2_maps[0])
+
     def update_widget_state(self, *args):
         self.__map_ult.set(sh.ultimate_levels[self.__custommgr.level_index])
         if self.__custommgr.level_index < len(sh.doom2_levels):
@@ -281,6 +589,9 @@ class GUIIwadLevelMenus(tk.Frame):
         else:
             self.__map_doom2.set(sh.doom2_levels[0])
         self.__iwad.set(sh.iwad_list[self.__custommgr.iwad_index])
+        found = iwads.available(Shell.iwad_roots(), sh.iwad_list)
+        self.__menu_iwad.set_options(found if bool(found) else sh.iwad_list)
+        self.update_map_lists()
 
 
 class GUITabVanilla(tk.Frame):
@@ -299,7 +610,17 @@ class GUITabVanilla(tk.Frame):
         )
         self.__game.set(self.__gamemgr.game)
         self.__skill.set(sh.skill_list[self.__gamemgr.skill_index])
+        self.__options = {}
+        # the files of the releases that can't be found, Master Levels by level index
+        self.__missing = {}
+        self.__missing_levels = set()
+        self.__check = 0
+        self.__normal_color = ""
         self.__deploy_widgets()
+        # hash the IWADs in the background, so the first launch doesn't have to
+        iwads.identifier.submit([
+            path for path in (iwads.find_named(Shell.iwadpath, iwad) for iwad in sh.iwad_list) if path is not None
+        ])
 
     def __deploy_widgets(self):
         self.__deploy_radiobuttons()
@@ -307,15 +628,17 @@ class GUITabVanilla(tk.Frame):
         tk.Label(master=self, text="Skill:").grid(column=0, row=7)
         GUIDropdownSkill(self.__gamemgr, self, self.__skill).grid(column=0, row=8)
         tk.Button(
-            master=self, text="Play!", command=self.__gamemgr.start_game, width=12
+            master=self, text="Play!", command=lambda: start_game(self.__gamemgr), width=12
         ).grid(row=9, column=0, pady=5)
 
     def __deploy_radiobuttons(self):
         tk.Label(master=self, text="Select Game").grid(column=0, row=0)
-        options = [tk.Radiobutton(master=self, value=game, text=sh.games[game]) for game in sh.games]
-        for i, radiobutton in enumerate(options):
+        for i, game in enumerate(sh.games):
+            radiobutton = tk.Radiobutton(master=self, value=game, text=sh.games[game])
             radiobutton.configure(variable=self.__game, command=self.__pass_game)
             radiobutton.grid(column=0, columnspan=1, row=i + 1, sticky=tk.W + tk.E, padx=15)
+            self.__options[game] = radiobutton
+        self.__normal_color = self.__options[sh.ULTIMATE].cget("fg")
 
     def __deploy_level_list(self):
         tk.Label(master=self, text="Select Level").grid(column=1, row=0, sticky=tk.W + tk.E)
@@ -330,6 +653,46 @@ class GUITabVanilla(tk.Frame):
         self.__level_list.select_clear(0, tk.END)
         self.__level_list.select_set(0)
         self.__level_list.event_generate("<<ListboxSelect>>")
+        self.__mark_levels()
+
+    def update_widget_state(self, *args):
+        """Look for the files of every release in the background and mark the ones that can't be played"""
+        self.__check += 1
+        results = queue.Queue()
+        threading.Thread(target=self.__find_missing, args=(results,), daemon=True).start()
+        self.after(RELEASE_CHECK_POLL_MS, self.__receive_missing, self.__check, results)
+
+    @staticmethod
+    def __find_missing(results: queue.Queue):
+        files = {game: sh.release_files(game) for game in sh.games}
+        levels = [sh.master_level_file(index) for index in range(len(sh.master_levels))]
+        missing = set(validation.validator.missing([path for paths in files.values() for path in paths] + levels))
+        results.put((
+            {game: [path for path in paths if path in missing] for game, paths in files.items()},
+            {index for index, path in enumerate(levels) if path in missing}
+        ))
+
+    def __receive_missing(self, check: int, results: queue.Queue):
+        if check != self.__check:
+            return
+        try:
+            self.__missing, self.__missing_levels = results.get_nowait()
+        except queue.Empty:
+            self.after(RELEASE_CHECK_POLL_MS, self.__receive_missing, check, results)
+            return
+        # the Master Levels can be played as long as any of their files is there
+        no_master_levels = len(self.__missing_levels) == len(sh.master_levels)
+        for game, radiobutton in self.__options.items():
+            if bool(self.__missing[game]) or (game == sh.MASTER and no_master_levels):
+                radiobutton.configure(text="{} (missing)".format(sh.games[game]), fg=MISSING_COLOR)
+            else:
+                radiobutton.configure(text=sh.games[game], fg=self.__normal_color)
+        self.__mark_levels()
+
+    def __mark_levels(self):
+        missing = self.__missing_levels if self.__gamemgr.game == sh.MASTER else ()
+        for index in range(self.__level_list.size()):
+            self.__level_list.itemconfigure(index, fg=MISSING_COLOR if index in missing else "")
 
     def __pass_game(self):
         self.__gamemgr.game = self.__game.get()
@@ -354,9 +717,14 @@ class GUITabCustom(tk.Frame):
         self.__iwad_panel = GUIIwadLevelMenus(self.__custommgr, self, bd=2, relief=tk.GROOVE)
         self.__demo_panel = GUIDemoOptions(self.__custommgr, self, bd=2, relief=tk.GROOVE)
         self.__deploy_widgets()
+        self.__files_select.load_order_changed.trace_add("write", self.__iwad_panel.update_map_lists)
+        self.__files_select.selection_changed.trace_add("write", self.__files_selected)
+        self.__demo_panel.demo_selected.trace_add("write", self.update_widget_state)
+        self.__complevel_job = None
         self.__fast.trace_add("write", lambda *a: setattr(self.__custommgr, "fast", self.__fast.get()))
         self.__resp.trace_add("write", lambda *a: setattr(self.__custommgr, "respawn", self.__resp.get()))
         self.__cmds.trace_add("write", lambda *a: setattr(self.__custommgr, "cmdline", self.__cmds.get()))
+        autosave.watch(self.__fast, self.__resp, self.__cmds)
 
     def __deploy_widgets(self):
         self.__files_select.grid(row=0, column=0, rowspan=11, sticky=tk.N + tk.W)
@@ -372,10 +740,51 @@ class GUITabCustom(tk.Frame):
         tk.Label(master=self, text="Additional parameters:").grid(row=8, column=2, columnspan=2)
         tk.Entry(master=self, textvariable=self.__cmds, width=40).grid(row=9, column=2, columnspan=2)
         tk.Button(
-            master=self, text="Play!", command=self.__custommgr.start_game, width=12
+            master=self, text="Play!", command=lambda: start_game(self.__custommgr), width=12
         ).grid(row=10, column=2, columnspan=2, pady=5)
         # self.update_widget_state()
 
+    def __files_selected(self, *args):
+        # the complevel suggestion depends on the IWAD
+        self.__preset_iwad()
+        self.__preset_complevel()
+
+    @tracing.traced("infer iwad")
+    def __preset_iwad(self):
+        """Switch to an IWAD of the game the selected files are made for, if the current one isn't"""
+        paths = [sh.pwad_path(file) for file in self.__custommgr.files if wad.is_wad_name(file)]
+        current = sh.iwad_list[self.__custommgr.iwad_index]
+        suggested = inference.suggest_iwad(
+            inference.families.verdicts(paths), current, iwads.available(Shell.iwad_roots(), sh.iwad_list)
+        )
+        if suggested != current:
+            self.__custommgr.iwad_index = sh.iwad_list.index(suggested)
+            self.__iwad_panel.update_widget_state()
+
+    def __preset_complevel(self, *args):
+        """Pick the compatibility mode from the analyzer verdicts of the selected files,
+        waiting for the background analysis instead of doing it on the GUI thread"""
+        if self.__complevel_job is not None:
+            self.after_cancel(self.__complevel_job)
+            self.__complevel_job = None
+        paths = [sh.pwad_path(file) for file in self.__custommgr.files]
+        verdicts = [analysis.complevels.verdict(path) for path in paths]
+        if None in verdicts:
+            missing = [path for path, verdict in zip(paths, verdicts) if verdict is None]
+            analysis.complevels.submit(missing)
+            # files that can't be analyzed at all, like missing ones, are never pending
+            if any(analysis.complevels.pending(path) for path in missing):
+                self.__complevel_job = self.after(COMPLEVEL_POLL_MS, self.__preset_complevel)
+                return
+            # the analysis may have finished in the meantime
+            verdicts = [analysis.complevels.verdict(path) for path in paths]
+        verdicts = [verdict for verdict in verdicts if verdict is not None and verdict["level"] is not None]
+        if bool(verdicts):
+            self.__custommgr.comp_index = analysis.suggest_comp_index(
+                verdicts, sh.iwad_list[self.__custommgr.iwad_index]
+            )
+            self.__complevel.set(sh.compat_list[self.__custommgr.comp_index])
+
     def update_widget_state(self, *args):
         self.__skill.set(sh.skill_list[self.__custommgr.skill_index])
         self.__complevel.set(sh.compat_list[self.__custommgr.comp_index])
@@ -387,79 +796,356 @@ class GUITabCustom(tk.Frame):
         self.__demo_panel.update_widget_state()
 
 
+class GUIVirtualList(tk.Frame):
+    """Multiple selection list that only puts the visible rows into Tk. The items and the selection
+    are kept in Python, so the list stays fast with any number of entries and can grow while a scan
+    is still running. Clicks toggle rows and fire <<ListboxSelect>> like a tk.Listbox does"""
+
+    WHEEL_ROWS = 3
+
+    def __init__(self, master, height=18, width=24, **kwargs):
+        super().__init__(master=master, **kwargs)
+        self.__items = []
+        self.__selected = set()
+        self.__top = 0
+        self.__height = height
+        self.__rows = tk.Listbox(
+            master=self, selectmode=tk.MULTIPLE, exportselection=0, height=height, width=width,
+            activestyle=tk.NONE, takefocus=0
+        )
+        self.__scroll = tk.Scrollbar(master=self, command=self.__yview, orient=tk.VERTICAL)
+        # the rows only show the selection, the Listbox's own bindings would change it behind our back
+        self.__rows.bind("<Button-1>", self.__click)
+        self.__rows.bind("<B1-Motion>", lambda evt: "break")
+        self.__rows.bind("<MouseWheel>", lambda evt: self.__wheel(-1 if evt.delta > 0 else 1))
+        self.__rows.bind("<Button-4>", lambda evt: self.__wheel(-1))
+        self.__rows.bind("<Button-5>", lambda evt: self.__wheel(1))
+        self.__scroll.grid(row=0, column=0, sticky=tk.N + tk.S + tk.E)
+        self.__rows.grid(row=0, column=1)
+        self.__redraw()
+
+    def size(self) -> int:
+        return len(self.__items)
+
+    def set_items(self, items):
+        """Replace the items and clear the selection, the view stays where it was if the list is long enough"""
+        self.__items = list(items)
+        self.__selected.clear()
+        self.__top = max(min(self.__top, len(self.__items) - self.__height), 0)
+        self.__redraw()
+
+    def curselection(self) -> tuple:
+        return tuple(sorted(self.__selected))
+
+    def select_set(self, index: int):
+        self.__selected.add(index)
+        self.__redraw()
+
+    def select_clear(self):
+        self.__selected.clear()
+        self.__redraw()
+
+    def see(self, index: int):
+        if index < self.__top:
+            self.__scroll_to(index)
+        elif index >= self.__top + self.__height:
+            self.__scroll_to(index - self.__height + 1)
+
+    def __click(self, evt):
+        index = self.__top + self.__rows.nearest(evt.y)
+        if index < len(self.__items):
+            if index in self.__selected:
+                self.__selected.discard(index)
+            else:
+                self.__selected.add(index)
+            self.__redraw()
+            self.event_generate("<<ListboxSelect>>")
+        return "break"
+
+    def __wheel(self, direction: int):
+        self.__scroll_to(self.__top + direction * self.WHEEL_ROWS)
+        return "break"
+
+    def __yview(self, *args):
+        if args[0] == tk.MOVETO:
+            self.__scroll_to(int(float(args[1]) * len(self.__items)))
+        elif args[0] == tk.SCROLL:
+            step = self.__height if args[2] == tk.PAGES else 1
+            self.__scroll_to(self.__top + int(args[1]) * step)
+
+    def __scroll_to(self, top: int):
+        top = max(min(top, len(self.__items) - self.__height), 0)
+        if top != self.__top:
+            self.__top = top
+            self.__redraw()
+
+    def __redraw(self):
+        visible = self.__items[self.__top:self.__top + self.__height]
+        self.__rows.delete(0, tk.END)
+        if bool(visible):
+            self.__rows.insert(0, *visible)
+        for row in range(len(visible)):
+            if self.__top + row in self.__selected:
+                self.__rows.select_set(row)
+        total = max(len(self.__items), 1)
+        self.__scroll.set(self.__top / total, min(self.__top + self.__height, total) / total)
+
+
 class GUIFileSelect(tk.Frame):
     def __init__(self, custommgr: ShellCustom, master, **kwargs):
         super().__init__(master=master, **kwargs)
         self.__custommgr = custommgr
-        self.__pwaddir_list = []
-        self.__file_list = tk.Listbox(master=self, selectmode=tk.MULTIPLE, exportselection=0, height=18, width=24)
+        self.__pwaddir_list = sh.LoadOrder()
+        # the files the list shows, all of them or the ones matching the search
+        self.__shown = self.__pwaddir_list
+        self.__names = {}
+        self.__indexing = None
+        self.__scan = 0
+        self.__watches = []
+        self.__query = tk.StringVar(self)
+        self.__query.trace_add("write", self.__filter)
+        self.__skipped = tk.StringVar(self)
+        self.__search_frame = tk.Frame(master=self)
+        self.__file_list = GUIVirtualList(master=self, height=18, width=24)
         self.__file_list.bind("<<ListboxSelect>>", self.__pass_files)
         self.__load_order = tk.StringVar(self)
         self.__load_order_widget = tk.Message(
             master=self, textvariable=self.__load_order, justify=tk.CENTER,
             bd=2, width=120, anchor=tk.W
         )
-        self.__listscroll = tk.Scrollbar(master=self, command=self.__file_list.yview, orient=tk.VERTICAL)
+        self.__overrides = tk.Listbox(master=self, height=16, width=32, exportselection=0, activestyle=tk.NONE)
+        self.__overrides_scroll = tk.Scrollbar(master=self, command=self.__overrides.yview, orient=tk.VERTICAL)
         self.__button_frame = tk.Frame(master=self)
+        self.load_order_changed = tk.BooleanVar(self)
+        self.selection_changed = tk.BooleanVar(self)
+        autosave.watch(self.load_order_changed)
         self.__deploy_widgets()
+        self.after(WATCH_POLL_MS, self.__poll_watches)
         # self.update_widget_state()
 
     def __deploy_widgets(self):
-        self.__file_list.grid(row=1, column=1, rowspan=2,)
-        self.__file_list.configure(yscrollcommand=self.__listscroll.set)
-        self.__listscroll.grid(row=1, column=0, rowspan=2, sticky=tk.N + tk.S + tk.E)
-        self.__load_order_widget.grid(row=1, column=2, sticky=tk.N, padx=10)
+        tk.Label(master=self.__search_frame, text="Search:").grid(row=0, column=0)
+        search_entry = tk.Entry(master=self.__search_frame, textvariable=self.__query, width=18)
+        search_entry.bind("<Escape>", lambda evt: self.__query.set(""))
+        search_entry.grid(row=0, column=1)
+        tk.Label(
+            master=self.__search_frame, textvariable=self.__skipped, fg="red", wraplength=200, justify=tk.LEFT
+        ).grid(row=1, column=0, columnspan=2, sticky=tk.W)
+        self.__search_frame.grid(row=1, column=0, columnspan=2, sticky=tk.E, pady=2)
+        self.__file_list.grid(row=2, column=0, columnspan=2, rowspan=2, sticky=tk.E)
+        self.__load_order_widget.grid(row=1, column=2, rowspan=3, sticky=tk.N, padx=10)
         tk.Label(master=self, text="Select custom files").grid(row=0, column=1)
         tk.Label(master=self, text="Load order:").grid(row=0, column=2)
+        tk.Label(master=self, text="Overridden lumps:").grid(row=0, column=3)
+        self.__overrides.configure(yscrollcommand=self.__overrides_scroll.set)
+        self.__overrides.grid(row=1, column=3, rowspan=3, sticky=tk.N)
+        self.__overrides_scroll.grid(row=1, column=4, rowspan=3, sticky=tk.N + tk.S)
         tk.Button(
             master=self.__button_frame, text="Refresh list", command=self.update_widget_state
         ).grid(row=0, column=0, padx=10)
         tk.Button(master=self.__button_frame, text="Clear all", command=self.__clear).grid(row=0, column=1, padx=10)
-        self.__button_frame.grid(row=3, column=0, columnspan=3, pady=5)
+        self.__button_frame.grid(row=4, column=0, columnspan=5, pady=5)
         self.columnconfigure(2, minsize=160)
 
     def update_widget_state(self, *args):
-        self.__pwaddir_list = [wad for wad in self.__match_extension("*.wad")]
-        self.__pwaddir_list.extend([deh for deh in self.__match_extension("*.deh")])
-        self.__pwaddir_list.extend([bex for bex in self.__match_extension("*.bex")])
-        self.__pwaddir_list = sorted(self.__pwaddir_list, key=lambda name: name.lower())
-        self.__file_list.delete(0, tk.END)
-        for i, file in enumerate(self.__pwaddir_list):
-            self.__file_list.insert(i, file)
-        self.__sync_selection()
-
-    def __match_extension(self, extension: str):
-        for file in os.listdir(Shell.pwadpath):
-            if fn.fnmatch(file, extension):
-                yield file
+        """Rescan the WAD folders in the background, the files of every folder are listed as soon as it's done"""
+        self.__scan += 1
+        self.__pwaddir_list = sh.LoadOrder()
+        self.__names = {}
+        self.__skipped.set("")
+        self.__show(self.__pwaddir_list)
+        results = queue.Queue()
+        roots = Shell.search_roots()
+        exclude = Shell.excluded_folders()
+        # watch before scanning, files that show up during the scan are then listed either way
+        for watch in self.__watches:
+            watcher.folders.unwatch(watch)
+        self.__watches = [
+            watcher.folders.watch(root, LIBRARY_PATTERNS, recursive=True, exclude=exclude) for root in roots
+        ]
+        threading.Thread(target=self.__search, args=(roots, exclude, results), daemon=True).start()
+        self.after(FILE_SCAN_POLL_MS, self.__receive_files, self.__scan, results)
+
+    @staticmethod
+    def __search(roots: list, exclude: list, results: queue.Queue):
+        found, skipped = library.index.search(
+            # a rescan stats every file again, also the ones overwritten in place
+            roots, LIBRARY_PATTERNS, exclude=exclude, refresh=True,
+            on_root=lambda root, files: results.put((root, archives.cache.expand(root, files)))
+        )
+        results.put((None, skipped))
+
+    def __receive_files(self, scan: int, results: queue.Queue):
+        if scan != self.__scan:
+            # a newer scan has replaced this one
+            return
+        while True:
+            try:
+                root, files = results.get_nowait()
+            except queue.Empty:
+                break
+            if root is None:
+                if bool(files):
+                    self.__skipped.set("Skipped, took too long to scan: {}".format(", ".join(files)))
+                # forget the files that are gone from the search index
+                search.index.submit([], keep=set(self.__names))
+                self.__sync_selection()
+                return
+            self.__add_files(root, files)
+        self.after(FILE_SCAN_POLL_MS, self.__receive_files, scan, results)
+
+    @staticmethod
+    def __prefix(root: str) -> str:
+        # files from the PWAD folder are relative to it, the other roots give absolute paths
+        return "" if root == Shell.pwadpath else os.path.abspath(root).replace(os.sep, "/") + "/"
+
+    @tracing.traced("list files")
+    def __add_files(self, root: str, files: list):
+        prefix = self.__prefix(root)
+        added = [
+            name for name in sorted((prefix + file for file in files), key=lambda name: name.lower())
+            if name not in self.__pwaddir_list
+        ]
+        # the roots finish in any order, so the batch is merged into the sorted list instead of appended
+        self.__pwaddir_list = sh.LoadOrder(
+            heapq.merge(self.__pwaddir_list, added, key=lambda name: name.lower())
+        )
+        self.__filter()
+        self.__index_files(added)
+
+    def __index_files(self, names: list):
+        paths = [sh.pwad_path(name) for name in names]
+        self.__names.update((os.path.abspath(path), name) for path, name in zip(paths, names))
+        # warm up the complevel cache for the whole library in the background
+        analysis.complevels.submit(paths)
+        self.__indexing = search.index.submit(paths)
+
+    @tracing.traced("filter files")
+    def __filter(self, *args):
+        query = self.__query.get()
+        if not bool(query.strip()):
+            self.__show(self.__pwaddir_list)
+            return
+        found = [self.__names[path] for path in search.index.search(query) if path in self.__names]
+        self.__show(sh.LoadOrder(sorted(found, key=self.__pwaddir_list.index)))
+
+    def __show(self, shown: sh.LoadOrder):
+        self.__shown = shown
+        self.__file_list.set_items(shown)
+        for name in self.__custommgr.files:
+            if name in shown:
+                self.__file_list.select_set(shown.index(name))
+
+    def __poll_watches(self):
+        for watch in self.__watches:
+            changes = watch.changes()
+            if any(change.kind == watcher.RESCAN for change in changes):
+                # folders were added or removed, the scan starts its own watches
+                self.update_widget_state()
+                break
+            if bool(changes):
+                prefix = self.__prefix(watch.folder)
+                self.__apply_changes(prefix, self.__archive_changes(watch.folder, prefix, changes))
+        if self.__indexing is not None and self.__indexing.done():
+            # files that weren't indexed yet can match the search now
+            self.__indexing = None
+            if bool(self.__query.get().strip()):
+                self.__filter()
+        self.after(WATCH_POLL_MS, self.__poll_watches)
+
+    def __archive_changes(self, root: str, prefix: str, changes: list) -> list:
+        """Replace the changes to archives by changes to the files inside them"""
+        result = []
+        for change in changes:
+            old = change.name
+            new = change.new_name if change.kind == watcher.RENAMED else change.name
+            if not archives.is_archive_name(old) and not archives.is_archive_name(new):
+                result.append(change)
+                continue
+            if change.kind != watcher.ADDED and archives.is_archive_name(old):
+                listed = prefix + old + "/"
+                result.extend(
+                    watcher.Change(watcher.REMOVED, name[len(prefix):], None)
+                    for name in self.__pwaddir_list if name.startswith(listed)
+                )
+            elif change.kind != watcher.ADDED:
+                result.append(watcher.Change(watcher.REMOVED, old, None))
+            if change.kind != watcher.REMOVED:
+                result.extend(
+                    watcher.Change(watcher.ADDED, file, None) for file in archives.cache.expand(root, [new])
+                )
+        return result
+
+    @tracing.traced("apply folder changes")
+    def __apply_changes(self, prefix: str, changes: list):
+        """Put the files added, removed or renamed on disk into the list without scanning the folders again"""
+        gone, new, rewritten = set(), set(), []
+        for change in changes:
+            if change.kind in (watcher.REMOVED, watcher.RENAMED):
+                gone.add(prefix + change.name)
+                new.discard(prefix + change.name)
+            if change.kind == watcher.ADDED:
+                new.add(prefix + change.name)
+                gone.discard(prefix + change.name)
+            elif change.kind == watcher.RENAMED:
+                new.add(prefix + change.new_name)
+                gone.discard(prefix + change.new_name)
+            elif change.kind == watcher.CHANGED:
+                rewritten.append(prefix + change.name)
+        new = {name for name in new if name not in self.__pwaddir_list}
+        gone = {name for name in gone if name in self.__pwaddir_list}
+        if bool(new) or bool(gone):
+            files = [name for name in self.__pwaddir_list if name not in gone] + list(new)
+            self.__pwaddir_list = sh.LoadOrder(sorted(files, key=lambda name: name.lower()))
+            self.__names = {path: name for path, name in self.__names.items() if name not in gone}
+            self.__filter()
+        if bool(new) or bool(rewritten):
+            self.__index_files(list(new) + rewritten)
+        if any(name in self.__custommgr.files for name in gone):
+            self.__custommgr.files.retain({name for name in self.__custommgr.files if name not in gone})
+            self.__load_order_upd()
+            self.selection_changed.set(True)
 
     def __pass_files(self, evt):
         # print(evt)
-        selection = self.__file_list.curselection()
-        new_list = [self.__pwaddir_list[i] for i in selection] if bool(selection) else []
-        added = [item for item in new_list if item not in self.__custommgr.files]
+        selection = [self.__shown[i] for i in self.__file_list.curselection()]
+        added = [item for item in selection if item not in self.__custommgr.files]
         if not bool(added):
-            self.__custommgr.files = [item for item in self.__custommgr.files if item in new_list]
+            # files hidden by the search or not scanned yet stay in the load order
+            chosen = set(selection)
+            self.__custommgr.files.retain({
+                item for item in self.__custommgr.files if item in chosen or item not in self.__shown
+            })
         else:
             self.__custommgr.files.extend(added)
         self.__load_order_upd()
+        self.selection_changed.set(True)
 
     def __sync_selection(self):
         if bool(self.__custommgr.files):
-            self.__custommgr.files = [item for item in self.__custommgr.files if item in self.__pwaddir_list]
-            for item in self.__custommgr.files:
-                self.__file_list.select_set(self.__pwaddir_list.index(item))
+            self.__custommgr.files.retain(self.__pwaddir_list)
             if bool(self.__file_list.curselection()):
                 self.__file_list.see(self.__file_list.curselection()[0])
         self.__load_order_upd()
 
     def __clear(self):
-        self.__file_list.select_clear(0, tk.END)
+        self.__file_list.select_clear()
         self.__custommgr.files = []
         self.__load_order_upd()
+        self.selection_changed.set(True)
 
     def __load_order_upd(self):
         self.__load_order.set('\n'.join(self.__custommgr.files))
+        self.__show_conflicts()
+        self.load_order_changed.set(True)
+
+    @tracing.traced("find conflicts")
+    def __show_conflicts(self):
+        """List the lumps a later file of the load order replaces and the file that wins"""
+        paths = [sh.pwad_path(file) for file in self.__custommgr.files if wad.is_wad_name(file)]
+        found = conflicts.analyzer.analyze(paths) if len(paths) > 1 else []
+        self.__overrides.delete(0, tk.END)
+        self.__overrides.insert(tk.END, *(str(conflict) for conflict in found))
 
 
 class GUIDemoOptions(tk.Frame):
@@ -481,11 +1167,13 @@ class GUIDemoOptions(tk.Frame):
             self.__frame_play, textvariable=self.__play_demo_name, width=25, command=self.__ask_demofile
         )
         self.__button_clear = tk.Button(self.__frame_play, text="Clear", command=self.__clear_play_demo)
+        self.demo_selected = tk.BooleanVar(self)
         self.__play_demo.trace_add("write", self.__pass_demoplay)
         self.__record_demo.trace_add("write", self.__pass_demorec)
         self.__record_demo_name.trace_add(
             "write", lambda *a: setattr(self.__custommgr, "demorec_name", self.__record_demo_name.get())
         )
+        autosave.watch(self.__record_demo, self.__record_demo_name, self.__play_demo, self.__play_demo_name)
         self.__deploy_widgets()
 
     def __deploy_widgets(self):
@@ -524,13 +1212,17 @@ class GUIDemoOptions(tk.Frame):
         self.__play_demo_name.set("..." + dem[len(dem) - 24:]) if len(dem) > 24 else self.__play_demo_name.set(dem)
 
     def __ask_demofile(self):
-        demo = fd.askopenfilename(
-            title="Locate demo to play", initialdir=Shell.demopath,
-            filetypes=[("Demo lumps", "*.lmp"), ("All files", "*.*")]
-        )
-        if bool(demo):
-            self.__custommgr.demoplay_name = demo
-            self.__play_demo_name_widget_update(demo)
+        GUIPopupDemoList(self.winfo_toplevel(), self.__demo_chosen)
+
+    def __demo_chosen(self, demo: str, info):
+        """Set up the playback options from the demo header, if it could be read"""
+        self.__custommgr.demoplay_name = demo
+        self.__play_demo_name_widget_update(demo)
+        if info is not None:
+            self.__custommgr.comp_index = info["comp_index"]
+            self.__custommgr.skill_index = info["skill"]
+            self.__custommgr.iwad_index = demos.suggest_iwad_index(info, self.__custommgr.iwad_index)
+            self.demo_selected.set(True)
 
     def __clear_play_demo(self):
         self.__custommgr.demoplay_name = ""
@@ -550,11 +1242,15 @@ class GUIMenuBar(tk.Menu):
         self.__ini_mgr = inimgr
         self.__make_savedirs = tk.BooleanVar(self)
         self.__opengl = tk.BooleanVar(self)
+        self.__sample_usage = tk.BooleanVar(self)
         self.__paths_menu = tk.Menu(self, tearoff=0)
         self.__video_menu = tk.Menu(self, tearoff=0)
         self.__presets_menu = tk.Menu(self, tearoff=0)
+        self.__recent_menu = tk.Menu(self, tearoff=0, postcommand=self.__list_recent)
         self.__help_menu = tk.Menu(self, tearoff=0)
-        self.update_state_required = tk.BooleanVar()
+        self.__store = None
+        self.update_state_required = tk.StringVar()
+        autosave.watch(self.__make_savedirs, self.__opengl, self.__sample_usage, self.update_state_required)
         self.update_widget_state()
         self.__deploy_menus()
 
@@ -568,19 +1264,24 @@ class GUIMenuBar(tk.Menu):
         self.add_cascade(label="Files", menu=self.__paths_menu)
         self.add_cascade(label="Video", menu=self.__video_menu)
         self.add_cascade(label="Presets", menu=self.__presets_menu)
+        self.add_cascade(label="Recent", menu=self.__recent_menu)
         self.add_cascade(label="Help", menu=self.__help_menu)
 
     def __deploy_paths_menu(self):
         self.__paths_menu.add_command(
-            label="IWADs location...", command=DirPath("Locate IWADs folder:", "iwadpath").request
+            label="IWADs location...", command=lambda: self.__release_path_change("Locate IWADs folder:", "iwadpath")
         )
         self.__paths_menu.add_command(
-            label="NERVE.WAD location...", command=DirPath("Locate NERVE.WAD folder:", "nrftlpath").request
+            label="NERVE.WAD location...",
+            command=lambda: self.__release_path_change("Locate NERVE.WAD folder:", "nrftlpath")
         )
         self.__paths_menu.add_command(
-            label="Master Levels location...", command=DirPath("Locate Master Levels folder:", "mlpath").request
+            label="Master Levels location...",
+            command=lambda: self.__release_path_change("Locate Master Levels folder:", "mlpath")
         )
         self.__paths_menu.add_command(label="PWADs location...", command=self.__pwadpath_change)
+        self.__paths_menu.add_command(label="Add WAD search folder...", command=self.__wadpath_add)
+        self.__paths_menu.add_command(label="Clear WAD search folders", command=self.__wadpaths_clear)
         self.__paths_menu.add_command(
             label="Saves location...", command=DirPath("Locate save folder:", "iwadpath").request
         )
@@ -611,20 +1312,53 @@ class GUIMenuBar(tk.Menu):
         self.__video_menu.add_command(
             label="Screen settings", command=lambda: GUIPopupScreenSet(self.__master.winfo_toplevel())
         )
+        if sampler.available():
+            self.__video_menu.add_checkbutton(
+                label="Record engine resource use", variable=self.__sample_usage,
+                command=lambda: setattr(Shell, "sample_usage", self.__sample_usage.get())
+            )
 
     def __deploy_presets_menu(self):
+        self.__presets_menu.add_command(label="Preset library...", command=self.__open_library)
+        self.__presets_menu.add_command(label="Save to library...", command=self.__save_to_library)
+        self.__presets_menu.add_separator()
         self.__presets_menu.add_command(label="Save current...", command=self.__save)
         self.__presets_menu.add_command(label="Load preset...", command=self.__load)
+        self.__presets_menu.add_command(label="Import .ini preset...", command=self.__import)
         self.__presets_menu.add_separator()
         self.__presets_menu.add_command(label="Restore defaults", command=self.__restore_defaults)
 
+    def __list_recent(self):
+        """Fill the menu with the recently started sessions each time it's opened"""
+        self.__recent_menu.delete(0, tk.END)
+        entries = recent.journal.entries()
+        for entry in entries:
+            self.__recent_menu.add_command(label=entry["title"], command=lambda entry=entry: relaunch(entry))
+        if not bool(entries):
+            self.__recent_menu.add_command(label="No recent sessions", state=tk.DISABLED)
+
+    def __release_path_change(self, title: str, attr: str):
+        # the official releases are looked up in these folders, their "(missing)" marks and the IWAD list change
+        DirPath(title, attr).request()
+        self.update_state_required.set(STATE_PATHS)
+
     def __pwadpath_change(self):
         DirPath("Locate custom WADs folder:", "pwadpath").request()
-        self.update_state_required.set(True)
+        self.update_state_required.set(STATE_PATHS)
+
+    def __wadpath_add(self):
+        folder = fd.askdirectory(title="Add a folder to search for WADs:", initialdir=Shell.pwadpath)
+        if bool(folder):
+            Shell.wadpaths = ';'.join(path for path in (Shell.wadpaths, folder) if bool(path))
+            self.update_state_required.set(STATE_PATHS)
+
+    def __wadpaths_clear(self):
+        Shell.wadpaths = ""
+        self.update_state_required.set(STATE_PATHS)
 
     def __restore_defaults(self):
         Shell.default_settings()
-        self.update_state_required.set(True)
+        self.update_state_required.set(' '.join((STATE_GLOBALS, STATE_PATHS)))
 
     def __save(self):
         file = fd.asksaveasfilename(
@@ -642,15 +1376,39 @@ class GUIMenuBar(tk.Menu):
         )
         if bool(file):
             self.__ini_mgr.load(file)
-            self.update_state_required.set(True)
+            self.update_state_required.set(' '.join(ALL_STATES))
+
+    def __preset_store(self) -> presets.PresetStore:
+        if self.__store is None:
+            self.__store = presets.PresetStore(self.__ini_mgr)
+        return self.__store
+
+    def __open_library(self):
+        GUIPopupPresetLibrary(
+            self.__master.winfo_toplevel(), self.__preset_store(),
+            lambda: self.update_state_required.set(' '.join(ALL_STATES))
+        )
+
+    def __save_to_library(self):
+        GUIPopupPresetName(self.__master.winfo_toplevel(), self.__preset_store().save)
+
+    def __import(self):
+        file = fd.askopenfilename(
+            title="Select preset to import...", initialdir="./inis",
+            filetypes=[(".INI config files", "*.ini"), ("All files", "*.*")]
+        )
+        if bool(file):
+            self.__preset_store().import_ini(file)
 
     def __exit_app(self):
         self.__ini_mgr.save()
+        analysis.complevels.shutdown()
         self.__master.winfo_toplevel().destroy()
 
     def update_widget_state(self, *args):
         self.__make_savedirs.set(Shell.make_savedirs)
         self.__opengl.set(Shell.opengl)
+        self.__sample_usage.set(Shell.sample_usage)
 
 
 class DirPath(object):
@@ -668,6 +1426,7 @@ class DirPath(object):
     def _apply(self):
         if bool(self._locate):
             setattr(self._obj, self._attr, self._locate)
+            autosave.schedule()
 
 
 class FilePath(DirPath):
@@ -680,6 +1439,75 @@ class FilePath(DirPath):
         self._apply()
 
 
+class GUITabLog(tk.Frame):
+    """The tail of the engine output, lines from stderr in red"""
+
+    def __init__(self, master, **kwargs):
+        super().__init__(master=master, **kwargs)
+        self.__seen = 0
+        self.__log_to_file = tk.BooleanVar(self)
+        self.__text = tk.Text(
+            master=self, height=20, width=64, wrap=tk.NONE, state=tk.DISABLED, font="TkFixedFont"
+        )
+        self.__scroll = tk.Scrollbar(master=self, command=self.__text.yview, orient=tk.VERTICAL)
+        self.__button_panel = tk.Frame(master=self)
+        autosave.watch(self.__log_to_file)
+        self.__deploy_widgets()
+        self.update_widget_state()
+        self.__poll_log()
+
+    def __deploy_widgets(self):
+        self.__text.configure(yscrollcommand=self.__scroll.set)
+        self.__text.tag_configure("stderr", foreground="red")
+        self.__text.grid(row=0, column=0, padx=(5, 0), pady=5)
+        self.__scroll.grid(row=0, column=1, sticky=tk.N + tk.S, pady=5)
+        tk.Checkbutton(
+            master=self.__button_panel, text="Also write to " + sh.ENGINE_LOG_FILE, variable=self.__log_to_file,
+            command=lambda: setattr(Shell, "log_engine_output", self.__log_to_file.get())
+        ).grid(row=0, column=0, padx=10)
+        tk.Button(master=self.__button_panel, text="Clear", command=self.__clear).grid(row=0, column=1, padx=10)
+        self.__button_panel.grid(row=1, column=0, columnspan=2, pady=4)
+
+    def update_widget_state(self, *args):
+        self.__log_to_file.set(Shell.log_engine_output)
+
+    def __poll_log(self):
+        self.__seen, lines = sh.engine_log.since(self.__seen)
+        if bool(lines):
+            # only follow the output if the view is at the end already
+            following = self.__text.yview()[1] >= 1.0
+            self.__text.configure(state=tk.NORMAL)
+            for pid, stream, line in lines:
+                self.__text.insert(tk.END, "[{}] {}\n".format(pid, line), stream)
+            excess = int(self.__text.index("end-1c").split(".")[0]) - 1 - sh.LOG_LINES
+            if excess > 0:
+                self.__text.delete("1.0", "{}.0".format(excess + 1))
+            self.__text.configure(state=tk.DISABLED)
+            if following:
+                self.__text.see(tk.END)
+        self.after(LOG_POLL_MS, self.__poll_log)
+
+    def __clear(self):
+        self.__text.configure(state=tk.NORMAL)
+        self.__text.delete("1.0", tk.END)
+        self.__text.configure(state=tk.DISABLED)
+
+
+class GUILazyTab(tk.Frame):
+    """Notebook page that builds its content the first time it's shown"""
+
+    def __init__(self, master, factory, **kwargs):
+        super().__init__(master=master, **kwargs)
+        self.__factory = factory
+        self.content = None
+
+    def build(self):
+        if self.content is None:
+            self.content = self.__factory(self)
+            self.content.pack()
+        return self.content
+
+
 class GUI(tk.Frame):
     def __init__(self, master=None, gamemgr=None, custommgr=None, inimgr=None, **kwargs):
         super().__init__(master=master, **kwargs)
@@ -687,30 +1515,76 @@ class GUI(tk.Frame):
         self.__gamemgr = Shell() if gamemgr is None else gamemgr
         self.__custommgr = ShellCustom() if custommgr is None else custommgr
         self.__ini_mgr = sh.IniManager(self.__custommgr) if inimgr is None else inimgr
+        self.__refreshable = collections.OrderedDict()
         self.__menu = GUIMenuBar(self, self.__ini_mgr)
+        self.register(self.__menu, STATE_GLOBALS)
         self.__tabs = ttk.Notebook(master=self)
-        self.__tab_vanilla = GUITabVanilla(self.__gamemgr, master=self.__tabs)
-        self.__tab_vanilla.pack()
-        self.__tab_custom = GUITabCustom(self.__custommgr, master=self.__tabs)
-        self.__tab_custom.pack()
+        self.__tab_vanilla = GUILazyTab(
+            self.__tabs, lambda master: self.register(GUITabVanilla(self.__gamemgr, master=master), STATE_PATHS)
+        )
+        self.__tab_custom = GUILazyTab(
+            self.__tabs, lambda master: self.register(
+                GUITabCustom(self.__custommgr, master=master), STATE_PATHS, STATE_CUSTOM
+            )
+        )
+        self.__tab_log = GUILazyTab(
+            self.__tabs, lambda master: self.register(GUITabLog(master=master), STATE_GLOBALS)
+        )
         self.__tabs.add(self.__tab_vanilla, text="Official Releases")
         self.__tabs.add(self.__tab_custom, text="Custom Game")
+        self.__tabs.add(self.__tab_log, text="Engine Log")
         self.__tabs.tab(0, sticky=tk.N + tk.S)
+        self.__tabs.bind("<<NotebookTabChanged>>", self.__build_current_tab)
         self.__tabs.grid()
+        self.__status = tk.StringVar(self)
+        tk.Label(master=self, textvariable=self.__status, anchor=tk.W).grid(sticky=tk.W + tk.E, padx=5)
         self.winfo_toplevel().config(menu=self.__menu)
+        self.__tab_vanilla.build()
         self.update_all()
         self.__update_state_required = self.__menu.update_state_required
-        self.__update_state_required.trace_add("write", self.update_all)
+        self.__update_state_required.trace_add(
+            "write", lambda *a: self.refresh(*self.__update_state_required.get().split())
+        )
         self.pack()
+        self.after(SESSION_POLL_MS, self.__poll_sessions)
+
+    def register(self, component, *states):
+        """Refresh the component with update_widget_state() whenever any of the states changes"""
+        self.__refreshable[component] = set(states)
+        return component
+
+    @tracing.traced("build tab")
+    def __build_current_tab(self, *args):
+        tab = self.nametowidget(self.__tabs.select())
+        if tab.content is None:
+            # a new tab is brought up to date once, later changes go through refresh()
+            content = tab.build()
+            if content in self.__refreshable:
+                content.update_widget_state()
+
+    def refresh(self, *states):
+        with tracing.tracer.span("refresh", states=' '.join(states)):
+            for component, depends in self.__refreshable.items():
+                if bool(depends.intersection(states)):
+                    component.update_widget_state()
 
     def update_all(self, *args):
-        for attr in (a for a in dir(self)):
-            item = getattr(self, attr, None)
-            if bool(getattr(item, "update_widget_state", None)):
-                item.update_widget_state()
+        self.refresh(*ALL_STATES)
+
+    def __poll_sessions(self):
+        """Report finished game sessions without blocking the mainloop"""
+        exited = sh.processes.poll_exits()
+        for current in exited:
+            self.__status.set("Session {} exited with code {}".format(current.pid, current.exit_code))
+        running = sh.processes.running()
+        if bool(running) and not bool(exited):
+            self.__status.set("Running sessions: {}".format(', '.join(str(proc.pid) for proc in running)))
+        self.after(SESSION_POLL_MS, self.__poll_sessions)
 
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support()   # the complevel analyzer starts worker processes
+    sh.remove_stale_response_files()
     root = MainWindow()
     root.title("PrBoom+ Launcher v0.1.2")
     try:
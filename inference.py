@@ -0,0 +1,148 @@
+import re
+import struct
+
+import library
+import wad
+
+FAMILY_CACHE_FILE = library.CACHE_DIR + "/families.json"
+# raised when the verdicts change, so the ones cached before are computed again
+FAMILY_CACHE_VERSION = 2
+
+DOOM = "doom"
+DOOM2 = "doom2"
+# the IWADs each game family runs on, the first one is picked when the current one doesn't fit
+FAMILY_IWADS = {
+    DOOM: ("DOOM.WAD", "freedoom1.wad"),
+    DOOM2: ("DOOM2.WAD", "PLUTONIA.WAD", "TNT.WAD", "freedoom2.wad")
+}
+
+SIDEDEF = struct.Struct("<hh8s8s8sh")
+SECTOR = struct.Struct("<hh8s8shhh")
+TEXTURE_COUNT = struct.Struct("<i")
+UDMF_TEXTURE = re.compile(rb'\b(?:texture(?:top|middle|bottom|floor|ceiling))\s*=\s*"([^"]{1,8})"', re.I)
+FLAT_MARKERS = ("F_START", "FF_START")
+FLAT_ENDS = ("F_END", "FF_END")
+# the Doom II list is far longer, so a family needs this many times the other's votes to win
+VOTE_MARGIN = 3
+
+
+def numbered(prefix: str, first: int, last: int, digits=1) -> set:
+    return {"{}{:0{}d}".format(prefix, number, digits) for number in range(first, last + 1)}
+
+
+# textures and flats only one of the families has, so a map that uses them needs that family's IWAD
+FAMILY_NAMES = {
+    DOOM: {
+        "AASTINKY", "COMPOHSO", "COMPTILE", "COMPWERD", "PLANET1", "SKY4", "STARTAN1",
+        "TEKWALL2", "TEKWALL3", "TEKWALL5"
+    },
+    DOOM2: set().union(
+        numbered("ASHWALL", 2, 7), numbered("BIGBRIK", 1, 3), numbered("BRICK", 1, 12), numbered("BRONZE", 1, 4),
+        numbered("BSTONE", 1, 3), numbered("MODWALL", 1, 4), numbered("PIPEWAL", 1, 2), numbered("ROCK", 1, 5),
+        numbered("SILVER", 1, 3), numbered("SPACEW", 2, 4), numbered("STUCCO", 1, 3), numbered("TANROCK", 2, 8),
+        numbered("TEKBRON", 1, 2), numbered("TEKGREN", 1, 5), numbered("WOODMET", 1, 4), numbered("ZIMMER", 1, 8),
+        numbered("ZZWOLF", 1, 13), numbered("ZZZFACE", 1, 9), numbered("RROCK", 1, 20, 2),
+        numbered("SLIME", 1, 16, 2), {"STUCCO", "SK_LEFT", "SK_RIGHT"}
+    )
+}
+
+
+def lump_name(raw: bytes) -> str:
+    return raw.split(b"\0", 1)[0].decode("ascii", "replace").upper()
+
+
+def defined_names(wadfile: wad.WadFile) -> set:
+    """The textures and flats the WAD brings along, using them says nothing about the IWAD"""
+    names = set()
+    in_flats = False
+    for lump in wadfile.lumps:
+        if lump.name in FLAT_MARKERS:
+            in_flats = True
+        elif lump.name in FLAT_ENDS:
+            in_flats = False
+        elif in_flats:
+            names.add(lump.name)
+        elif lump.name in ("TEXTURE1", "TEXTURE2"):
+            data = wadfile.read(lump)
+            count = TEXTURE_COUNT.unpack_from(data, 0)[0]
+            offsets = struct.unpack_from("<{}i".format(count), data, 4)
+            names.update(lump_name(data[offset:offset + 8]) for offset in offsets if 0 <= offset <= len(data) - 8)
+    return names
+
+
+def used_names(wadfile: wad.WadFile) -> set:
+    """The textures and flats the maps of the WAD put on their walls, floors and ceilings"""
+    names = set()
+    for lump in wadfile.lumps:
+        if lump.name == "SIDEDEFS":
+            data = wadfile.read(lump)
+            for side in SIDEDEF.iter_unpack(data[:len(data) - len(data) % SIDEDEF.size]):
+                names.update(side[2:5])
+        elif lump.name == "SECTORS":
+            data = wadfile.read(lump)
+            for sector in SECTOR.iter_unpack(data[:len(data) - len(data) % SECTOR.size]):
+                names.update(sector[2:4])
+        elif lump.name == "TEXTMAP":
+            names.update(UDMF_TEXTURE.findall(wadfile.read(lump)))
+    return {lump_name(name) for name in names}
+
+
+def infer_family(path: str) -> dict:
+    """Tell from its map markers which game a WAD is made for. Only when it has no maps of
+    a single kind, the textures and flats its maps use are looked at"""
+    if not wad.is_wad_name(path):
+        return {"family": None}
+    with wad.WadFile(path) as wadfile:
+        maps = wadfile.maps()
+        # map_markers() only lets through ExMy and MAPxx
+        episodic = any(wad.EPISODE_MAP.match(name) for name in maps)
+        numbered_maps = any(not wad.EPISODE_MAP.match(name) for name in maps)
+        if episodic != numbered_maps:
+            return {"family": DOOM if episodic else DOOM2}
+        if not bool(maps):
+            return {"family": None}
+        try:
+            used = used_names(wadfile) - defined_names(wadfile)
+        except struct.error:
+            return {"family": None}
+    votes = {family: len(used & names) for family, names in FAMILY_NAMES.items()}
+    for family, other in ((DOOM, DOOM2), (DOOM2, DOOM)):
+        if votes[family] > 0 and votes[family] >= VOTE_MARGIN * votes[other]:
+            return {"family": family}
+    return {"family": None}
+
+
+def suggest_iwad(verdicts: list, current: str, found: list) -> str:
+    """Keep the current IWAD if it runs the files, otherwise pick the first one of their family
+    that's installed. Files of both families or of none, or a family with no IWAD installed,
+    leave the choice to the user"""
+    families = {verdict["family"] for verdict in verdicts if verdict is not None and verdict["family"] is not None}
+    if len(families) != 1:
+        return current
+    compatible = FAMILY_IWADS[families.pop()]
+    if current in compatible:
+        return current
+    installed = [iwad for iwad in compatible if iwad in found]
+    return installed[0] if bool(installed) else current
+
+
+class FamilyInference(object):
+    """Which game each PWAD is made for, cached on (size, mtime) in inis/families.json"""
+
+    def __init__(self, cache_file=FAMILY_CACHE_FILE):
+        self.cache = library.FileCache(cache_file, FAMILY_CACHE_VERSION)
+
+    def verdict(self, path: str):
+        """Return {"family": DOOM, DOOM2 or None} for the file, None if it can't be read"""
+        try:
+            return self.cache.get(path, infer_family)
+        except (OSError, ValueError):
+            return None
+
+    def verdicts(self, paths: list) -> list:
+        verdicts = [self.verdict(path) for path in paths]
+        self.cache.save()
+        return verdicts
+
+
+families = FamilyInference()
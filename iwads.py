@@ -0,0 +1,147 @@
+import collections
+import concurrent.futures as cf
+import hashlib
+import os
+import os.path
+
+import library
+
+IWAD_CACHE_FILE = library.CACHE_DIR + "/iwads.json"
+CHUNK_SIZE = 1 << 20
+IWAD_PATTERNS = ("*.wad", "*.WAD")
+
+Release = collections.namedtuple("Release", ("title", "iwad", "complevel"))
+
+# MD5 of the official IWAD releases: which file name the launcher knows them under and their complevel
+known_releases = {
+    "1cd63c5ddff1bf8ce844237f580e9cf3": Release("DOOM 1.9", "DOOM.WAD", 2),
+    "c4fe9fd920207691a9f493668e0a2083": Release("The Ultimate DOOM 1.9", "DOOM.WAD", 3),
+    "fb35c4a5a9fd49ec29ab6e900572c524": Release("The Ultimate DOOM (BFG Edition)", "DOOM.WAD", 3),
+    "25e1459ca71d321525f84628f45ca8cd": Release("DOOM 2 1.9", "DOOM2.WAD", 2),
+    "c3bea40570c23e511a7ed3ebcd9865f7": Release("DOOM 2 (BFG Edition)", "DOOM2.WAD", 2),
+    "75c8cf89566741fa9d22447604053bd7": Release("Final DOOM: Plutonia 1.9", "PLUTONIA.WAD", 4),
+    "3493be7e1e2588bc9c8b31eab2587a04": Release("Final DOOM: Plutonia (id Anthology)", "PLUTONIA.WAD", 4),
+    "4e158d9953c79ccf97bd0663244cc6b6": Release("Final DOOM: TNT 1.9", "TNT.WAD", 4),
+    "1d39e405bf6ee3df69a8d2646c8d5c49": Release("Final DOOM: TNT (id Anthology)", "TNT.WAD", 4),
+}
+
+
+def file_digest(path: str) -> str:
+    """MD5 of a file read in fixed-size chunks, hashlib releases the GIL while it works on them"""
+    digest = hashlib.md5()
+    with open(path, "rb") as source:
+        for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_iwad(path: str) -> bool:
+    try:
+        with open(path, "rb") as source:
+            return source.read(4) == b"IWAD"
+    except OSError:
+        return False
+
+
+class IwadIdentifier(object):
+    """Identify IWADs by their contents instead of their names. Digests are hashed on a
+    thread pool and cached on (inode, size, mtime), so every file is only read once per change"""
+
+    def __init__(self, cache_file=IWAD_CACHE_FILE, workers=4):
+        self.cache = library.FileCache(cache_file)
+        self.__workers = workers
+        self.__pool = None
+
+    def __executor(self) -> cf.ThreadPoolExecutor:
+        if self.__pool is None:
+            self.__pool = cf.ThreadPoolExecutor(max_workers=self.__workers)
+        return self.__pool
+
+    def cached_digest(self, path: str):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        cached = self.cache.lookup(path, stat)
+        return cached["md5"] if cached is not None and cached["inode"] == stat.st_ino else None
+
+    def digest(self, path: str) -> str:
+        cached = self.cached_digest(path)
+        if cached is not None:
+            return cached
+        stat = os.stat(path)
+        md5 = file_digest(path)
+        self.cache.store(path, {"inode": stat.st_ino, "md5": md5}, stat)
+        return md5
+
+    def __try_digest(self, path: str):
+        try:
+            return self.digest(path)
+        except OSError:
+            return None
+
+    def submit(self, paths: list) -> list:
+        """Hash the files in the background, returns the futures of the digests"""
+        futures = [self.__executor().submit(self.digest, path) for path in paths if os.path.isfile(path)]
+        for future in futures:
+            future.add_done_callback(lambda done: self.cache.save())
+        return futures
+
+    def release(self, path: str, wait=True):
+        """Return the known release the file contains, or None if it's unknown or not hashed yet"""
+        try:
+            md5 = self.digest(path) if wait else self.cached_digest(path)
+        except OSError:
+            return None
+        self.cache.save()
+        return known_releases.get(md5)
+
+    def locate(self, folders: list, iwad_name: str, wait=True, content_folders=None):
+        """Find the file with the IWAD in the folders: the first file with its name, unless that one
+        holds another game, then any IWAD in content_folders (all the folders by default) with the
+        right contents. Opening every WAD is only cheap in a folder that holds little else.
+        Without wait only the cached digests are used and the missing ones are hashed in the background.
+        Returns (path, release), release is None for unknown versions"""
+        named = [path for path in (find_named(folder, iwad_name) for folder in folders) if path is not None]
+        if not wait:
+            self.submit([path for path in named if self.cached_digest(path) is None])
+        for path in named:
+            release = self.release(path, wait)
+            if release is None or release.iwad == iwad_name:
+                return path, release
+        candidates = [
+            "{}/{}".format(folder, name) for folder in (folders if content_folders is None else content_folders)
+            for name in library.match_patterns(list(library.index.entries(folder)), IWAD_PATTERNS)
+        ]
+        candidates = [candidate for candidate in candidates if candidate not in named and is_iwad(candidate)]
+        if wait:
+            digests = self.__executor().map(self.__try_digest, candidates)
+        else:
+            digests = [self.cached_digest(candidate) for candidate in candidates]
+            self.submit([candidate for candidate, md5 in zip(candidates, digests) if md5 is None])
+        for candidate, md5 in zip(candidates, digests):
+            found = known_releases.get(md5)
+            if found is not None and found.iwad == iwad_name:
+                self.cache.save()
+                return candidate, found
+        self.cache.save()
+        if bool(named):
+            return named[0], self.release(named[0], wait)
+        return "{}/{}".format(folders[0], iwad_name), None
+
+
+def find_named(folder: str, name: str):
+    """Return the path of the file with the name in the folder, ignoring the case of the name"""
+    if name in library.index.entries(folder):
+        return "{}/{}".format(folder, name)
+    found = library.index.snapshot(folder).get(name.lower())
+    return "{}/{}".format(folder, found) if found is not None else None
+
+
+def available(folders: list, names) -> list:
+    """Return the IWAD names that have a file in any of the folders"""
+    snapshots = [library.index.snapshot(folder) for folder in folders]
+    return [name for name in names if any(name.lower() in snapshot for snapshot in snapshots)]
+
+
+identifier = IwadIdentifier()
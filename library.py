@@ -0,0 +1,257 @@
+import collections
+import fnmatch as fn
+import json
+import os
+import os.path
+import threading
+import time
+
+import tracing
+
+CACHE_DIR = "./inis"
+INDEX_FILE = CACHE_DIR + "/library.json"
+PWAD_PATTERNS = ("*.wad", "*.deh", "*.bex")
+ROOT_TIMEOUT = 5
+# seconds after which the entries of an unchanged folder are stat'ed again, a file overwritten in place
+# changes neither the folder's mtime nor its own inode
+REVALIDATE_TTL = 30
+# set for dry runs: the caches, the index and the other JSON files are only read then
+read_only = False
+
+
+def write_json(path: str, data):
+    """Write a JSON file through a temporary file, so that a crash never leaves it half-written"""
+    if read_only:
+        return
+    folder = os.path.dirname(path)
+    if bool(folder) and not os.path.exists(folder):
+        os.makedirs(folder)
+    temp = path + ".tmp"
+    with open(temp, "w") as target:
+        json.dump(data, target, separators=(',', ':'))
+    os.replace(temp, path)
+
+
+def read_json(path: str, version: int, default):
+    """Read a JSON file written by write_json, falling back to default when it's missing or outdated"""
+    try:
+        with open(path) as source:
+            data = json.load(source)
+        return data["data"] if data.get("version") == version else default
+    except (OSError, ValueError, KeyError, AttributeError):
+        return default
+
+
+def match_patterns(names, patterns) -> list:
+    """Filter file names with fnmatch patterns, keeping the original order"""
+    matched = set()
+    for pattern in patterns:
+        matched.update(fn.filter(names, pattern))
+    return [name for name in names if name in matched]
+
+
+class LibraryIndex(object):
+    """Persistent index of the files in WAD folders, stored as a compact JSON file.
+    A folder is scanned with a single os.scandir pass only when its mtime changes, and the
+    entries that still have the same inode keep their cached (size, mtime). A file overwritten
+    in place keeps both, so every entry is stat'ed again on a refresh, the first lookup of the
+    folder after the launcher starts and once its last check is REVALIDATE_TTL seconds old"""
+
+    VERSION = 2
+
+    def __init__(self, index_file=INDEX_FILE):
+        self.__index_file = index_file
+        self.__dirs = None
+        self.__dirty = False
+        self.__checked = {}
+        self.__snapshots = {}
+        self.__lock = threading.RLock()
+
+    def __load(self):
+        if self.__dirs is None:
+            self.__dirs = read_json(self.__index_file, self.VERSION, {})
+
+    def save(self):
+        with self.__lock:
+            if self.__dirty:
+                write_json(self.__index_file, {"version": self.VERSION, "data": self.__dirs})
+                self.__dirty = False
+
+    def __folder(self, path: str, refresh=False) -> dict:
+        key = os.path.abspath(path)
+        try:
+            dir_mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            with self.__lock:
+                self.__load()
+                if self.__dirs.pop(key, None) is not None:
+                    self.__dirty = True
+            return {"mtime": 0, "entries": {}, "dirs": []}
+        now = time.monotonic()
+        with self.__lock:
+            self.__load()
+            cached = self.__dirs.get(key)
+            checked = self.__checked.get(key)
+        recheck = refresh or checked is None or now - checked >= REVALIDATE_TTL
+        if cached is not None and cached["mtime"] == dir_mtime and not recheck:
+            return cached
+        known = cached["entries"] if cached is not None else {}
+        entries = {}
+        dirs = []
+        try:
+            with os.scandir(path) as folder:
+                for entry in folder:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            dirs.append(entry.name)
+                            continue
+                        elif not entry.is_file():
+                            continue
+                        inode = entry.inode()
+                        old = known.get(entry.name)
+                        if old is not None and bool(inode) and old[2] == inode and not recheck:
+                            entries[entry.name] = old
+                            continue
+                        stat = entry.stat()
+                        new = [stat.st_size, stat.st_mtime_ns, inode]
+                        entries[entry.name] = old if old == new else new
+                    except OSError:
+                        continue
+        except OSError:
+            pass
+        record = {"mtime": dir_mtime, "entries": entries, "dirs": dirs}
+        with self.__lock:
+            if recheck:
+                self.__checked[key] = now
+            if record == cached:
+                return cached
+            self.__dirs[key] = record
+            self.__dirty = True
+        return record
+
+    def entries(self, path: str, refresh=False) -> dict:
+        """Return {name: [size, mtime_ns, inode]} for every regular file in the folder"""
+        return self.__folder(path, refresh)["entries"]
+
+    def snapshot(self, path: str) -> dict:
+        """Return {lowercase name: name} for the files in the folder, built once per listing,
+        so looking up many names doesn't go through the whole folder for each of them"""
+        key = os.path.abspath(path)
+        entries = self.entries(path)
+        with self.__lock:
+            snapshot = self.__snapshots.get(key)
+            if snapshot is None or snapshot[0] is not entries:
+                folded = {}
+                for name in entries:
+                    folded.setdefault(name.lower(), name)
+                snapshot = self.__snapshots[key] = (entries, folded)
+        return snapshot[1]
+
+    def files(self, path: str, patterns=PWAD_PATTERNS) -> list:
+        """Return the names of the files in the folder matching any of the patterns"""
+        names = match_patterns(list(self.entries(path)), patterns)
+        self.save()
+        return names
+
+    def walk(self, root: str, patterns=PWAD_PATTERNS, exclude=(), refresh=False) -> list:
+        """Return the paths relative to root of the matching files in root and all of its subfolders.
+        The subfolders in exclude aren't descended into, refresh stats every entry again"""
+        excluded = {os.path.abspath(folder) for folder in exclude}
+        found = []
+        pending = [""]
+        with tracing.tracer.span("scan folder", root=root):
+            while bool(pending):
+                relative = pending.pop()
+                record = self.__folder(os.path.join(root, relative) if bool(relative) else root, refresh)
+                prefix = relative + "/" if bool(relative) else ""
+                found.extend(prefix + name for name in match_patterns(list(record["entries"]), patterns))
+                pending.extend(
+                    prefix + name for name in record["dirs"]
+                    if os.path.abspath(os.path.join(root, prefix + name)) not in excluded
+                )
+        return found
+
+    @tracing.traced("search folders")
+    def search(
+            self, roots: list, patterns=PWAD_PATTERNS, timeout=ROOT_TIMEOUT, on_root=None, exclude=(), refresh=False
+    ):
+        """Walk the roots in parallel, a root that takes longer than the timeout is skipped
+        instead of stalling the others. on_root(root, paths) is called from this thread as soon
+        as each root is done. Returns ({root: [relative paths]}, [skipped roots])"""
+        if not bool(roots):
+            return collections.OrderedDict(), []
+        # the thread pools are only loaded for a scan, the command line never needs them
+        import concurrent.futures as cf
+        pool = cf.ThreadPoolExecutor(max_workers=len(roots))
+        futures = [pool.submit(self.walk, root, patterns, exclude, refresh) for root in roots]
+        try:
+            for future in cf.as_completed(futures, timeout=timeout):
+                if on_root is not None and future.exception() is None:
+                    on_root(roots[futures.index(future)], future.result())
+        except cf.TimeoutError:
+            pass
+        pool.shutdown(wait=False)
+        found = collections.OrderedDict()
+        skipped = []
+        for root, future in zip(roots, futures):
+            if future.done() and future.exception() is None:
+                found[root] = future.result()
+            else:
+                skipped.append(root)
+        self.save()
+        return found, skipped
+
+
+class FileCache(object):
+    """Persistent per-file results keyed on (path, size, mtime): a value is computed again
+    only when the file it was computed from changes. Safe to use from worker threads"""
+
+    VERSION = 1
+
+    def __init__(self, cache_file: str, version=VERSION):
+        # a cache whose values are computed differently than before gets a new version
+        self.__cache_file = cache_file
+        self.__version = version
+        self.__entries = None
+        self.__dirty = False
+        self.__lock = threading.Lock()
+
+    def __load(self):
+        if self.__entries is None:
+            self.__entries = read_json(self.__cache_file, self.__version, {})
+
+    def lookup(self, path: str, stat=None):
+        """Return the cached value for an unchanged file, or None"""
+        stat = os.stat(path) if stat is None else stat
+        with self.__lock:
+            self.__load()
+            cached = self.__entries.get(os.path.abspath(path))
+        if cached is not None and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+        return None
+
+    def store(self, path: str, value, stat=None):
+        stat = os.stat(path) if stat is None else stat
+        with self.__lock:
+            self.__load()
+            self.__entries[os.path.abspath(path)] = [stat.st_size, stat.st_mtime_ns, value]
+            self.__dirty = True
+
+    def get(self, path: str, compute):
+        """Return the cached value for the file, calling compute(path) if it's missing or stale"""
+        stat = os.stat(path)
+        value = self.lookup(path, stat)
+        if value is None:
+            value = compute(path)
+            self.store(path, value, stat)
+        return value
+
+    def save(self):
+        with self.__lock:
+            if self.__dirty:
+                write_json(self.__cache_file, {"version": self.__version, "data": self.__entries})
+                self.__dirty = False
+
+
+# shared by the GUI and the other library helpers
+index = LibraryIndex()
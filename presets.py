@@ -0,0 +1,163 @@
+import configparser as cp
+import os.path
+import sqlite3
+import time
+from urllib.request import pathname2url
+
+import library
+import shell as sh
+
+PRESET_DB_FILE = library.CACHE_DIR + "/presets.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS presets (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE COLLATE NOCASE,
+    iwad TEXT NOT NULL DEFAULT '',
+    last_used REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS preset_fields (
+    preset_id INTEGER NOT NULL REFERENCES presets(id) ON DELETE CASCADE,
+    section TEXT NOT NULL,
+    field TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (preset_id, section, field)
+);
+CREATE TABLE IF NOT EXISTS preset_files (
+    preset_id INTEGER NOT NULL REFERENCES presets(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    file TEXT NOT NULL COLLATE NOCASE,
+    PRIMARY KEY (preset_id, position)
+);
+CREATE INDEX IF NOT EXISTS presets_iwad ON presets(iwad);
+CREATE INDEX IF NOT EXISTS presets_last_used ON presets(last_used);
+CREATE INDEX IF NOT EXISTS preset_files_file ON preset_files(file);
+"""
+
+
+class PresetStore(object):
+    """Presets kept in an sqlite database with indexed lookup by name, IWAD, file and last use.
+    Saving a preset only writes the fields that changed, loading only applies the fields that
+    differ from the current state. The .ini preset format can be imported and exported"""
+
+    def __init__(self, inimgr: sh.IniManager, db_file=PRESET_DB_FILE):
+        self.__ini_mgr = inimgr
+        created = not os.path.exists(db_file)
+        if library.read_only:
+            # a dry run reads the database, or the .ini presets into memory when there's none yet
+            self.__db = sqlite3.connect(
+                ":memory:" if created else "file:{}?mode=ro".format(pathname2url(os.path.abspath(db_file))), uri=True
+            )
+        else:
+            folder = os.path.dirname(db_file)
+            if bool(folder) and not os.path.exists(folder):
+                os.makedirs(folder)
+            self.__db = sqlite3.connect(db_file)
+        self.__db.execute("PRAGMA foreign_keys = ON")
+        with self.__db:
+            self.__db.executescript(SCHEMA)
+        if created:
+            # bring in the presets saved as .ini files before the database existed
+            self.import_folder(inimgr.INI_DIR)
+
+    def close(self):
+        self.__db.close()
+
+    def __preset_id(self, name: str):
+        row = self.__db.execute("SELECT id FROM presets WHERE name = ?", (name,)).fetchone()
+        return row[0] if row is not None else None
+
+    def search(self, text="", iwad=None, file=None, limit=200) -> list:
+        """Return (name, iwad, last_used) of the presets whose name starts with the text,
+        and that use the IWAD and contain the file if these are given, the most recently used first"""
+        query = "SELECT name, iwad, last_used FROM presets WHERE name LIKE ? ESCAPE '\\'"
+        args = [text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%']
+        if iwad is not None:
+            query += " AND iwad = ?"
+            args.append(iwad)
+        if file is not None:
+            query += " AND id IN (SELECT preset_id FROM preset_files WHERE file = ?)"
+            args.append(file)
+        query += " ORDER BY last_used DESC, name LIMIT ?"
+        args.append(limit)
+        return self.__db.execute(query, args).fetchall()
+
+    def fields(self, name: str) -> dict:
+        fields = {}
+        rows = self.__db.execute(
+            "SELECT section, field, value FROM preset_fields WHERE preset_id = ?", (self.__preset_id(name),)
+        )
+        for section, field, value in rows:
+            fields.setdefault(section, {})[field] = value
+        return fields
+
+    def store(self, name: str, fields: dict):
+        """Create or update a preset from settings in the .ini format, writing only the changed fields"""
+        custom = fields.get(self.__ini_mgr.SECT_CUSTM, {})
+        try:
+            iwad = sh.iwad_list[int(custom.get("iwad_index", ""))]
+        except (ValueError, IndexError):
+            iwad = ""
+        with self.__db:
+            preset_id = self.__preset_id(name)
+            if preset_id is None:
+                preset_id = self.__db.execute("INSERT INTO presets (name) VALUES (?)", (name,)).lastrowid
+            self.__db.execute(
+                "UPDATE presets SET iwad = ?, last_used = ? WHERE id = ?", (iwad, time.time(), preset_id)
+            )
+            old = self.fields(name)
+            changed = [
+                (preset_id, section, field, value) for section, values in fields.items()
+                for field, value in values.items() if old.get(section, {}).get(field) != value
+            ]
+            self.__db.executemany(
+                "INSERT OR REPLACE INTO preset_fields (preset_id, section, field, value) VALUES (?, ?, ?, ?)", changed
+            )
+            if "files" in custom and custom["files"] != old.get(self.__ini_mgr.SECT_CUSTM, {}).get("files"):
+                files = custom["files"].split(';') if bool(custom["files"]) else []
+                self.__db.execute("DELETE FROM preset_files WHERE preset_id = ?", (preset_id,))
+                self.__db.executemany(
+                    "INSERT INTO preset_files (preset_id, position, file) VALUES (?, ?, ?)",
+                    [(preset_id, i, file) for i, file in enumerate(files)]
+                )
+
+    def save(self, name: str):
+        """Store the current settings under the name"""
+        self.store(name, self.__ini_mgr.fields())
+
+    def load(self, name: str) -> bool:
+        fields = self.fields(name)
+        if not bool(fields):
+            return False
+        self.__ini_mgr.apply_fields(fields)
+        if library.read_only:
+            return True
+        with self.__db:
+            self.__db.execute("UPDATE presets SET last_used = ? WHERE name = ?", (time.time(), name))
+        return True
+
+    def delete(self, name: str):
+        with self.__db:
+            self.__db.execute("DELETE FROM presets WHERE name = ?", (name,))
+
+    def import_ini(self, ini_file: str, name=None):
+        """Store an .ini preset, named after the file unless a name is given"""
+        ini = cp.ConfigParser()
+        if not bool(ini.read(ini_file)):
+            return None
+        name = os.path.splitext(os.path.basename(ini_file))[0] if name is None else name
+        self.store(name, {section: dict(ini[section]) for section in ini.sections()})
+        return name
+
+    def import_folder(self, folder: str) -> list:
+        """Import every .ini preset in the folder except the launcher's own state"""
+        files = library.match_patterns(list(library.index.entries(folder)), ("*.ini",))
+        return [
+            self.import_ini("{}/{}".format(folder, file)) for file in files if file != self.__ini_mgr.INI_DEFAULT
+        ]
+
+    def export_ini(self, name: str, ini_file: str):
+        ini = cp.ConfigParser()
+        ini.read_dict(self.fields(name))
+        with open(ini_file, "w") as exported:
+            ini.write(exported)
@@ -0,0 +1,78 @@
+import os
+import os.path
+import shutil
+import threading
+import time
+
+import library
+import validation
+
+RECENT_FILE = library.CACHE_DIR + "/recent.json"
+RECENT_SESSIONS = 10
+
+
+def fingerprint(argv: list, cwd: str) -> list:
+    """[path, size, mtime_ns] of the executable and every file the arguments refer to, None for missing ones"""
+    exe = shutil.which(argv[0])
+    paths = [exe if exe is not None else argv[0]] + [
+        name for option, path in validation.referenced_paths(argv)
+        for name in (validation.demo_names(path) if option in validation.DEMO_OPTIONS else [path])
+    ]
+    paths = [os.path.join(cwd, path) for path in paths]
+    stats = validation.validator.stat_all(paths)
+    return [
+        [path, stats[path].st_size, stats[path].st_mtime_ns] if stats[path] is not None else [path, None, None]
+        for path in paths
+    ]
+
+
+class RecentSessions(object):
+    """The last sessions that were started, newest first, with everything needed to start them again:
+    the final argument vector, the working directory, the save folder and the size and mtime of every
+    file the arguments refer to. Kept in inis/recent.json"""
+
+    VERSION = 1
+
+    def __init__(self, recent_file=RECENT_FILE, size=RECENT_SESSIONS):
+        self.__recent_file = recent_file
+        self.__size = size
+        self.__lock = threading.Lock()
+        self.__entries = None
+
+    def __load(self):
+        if self.__entries is None:
+            self.__entries = library.read_json(self.__recent_file, self.VERSION, [])
+
+    def entries(self) -> list:
+        with self.__lock:
+            self.__load()
+            return list(self.__entries)
+
+    def record(self, title: str, argv: list, cwd: str, savedir: str, settings: dict, custom: bool, state: dict):
+        """Put the session first, dropping an older entry with the same command line"""
+        entry = {
+            "title": title, "argv": argv, "cwd": cwd, "savedir": savedir, "settings": settings,
+            "custom": custom, "state": state, "fingerprint": fingerprint(argv, cwd), "time": time.time()
+        }
+        self.__put(entry)
+        return entry
+
+    def touch(self, entry: dict):
+        """Move an entry that was started again to the front"""
+        self.__put(dict(entry, time=time.time()))
+
+    def __put(self, entry: dict):
+        with self.__lock:
+            self.__load()
+            self.__entries = [entry] + [
+                old for old in self.__entries if old["argv"] != entry["argv"] or old["cwd"] != entry["cwd"]
+            ][:self.__size - 1]
+            library.write_json(self.__recent_file, {"version": self.VERSION, "data": self.__entries})
+
+    @staticmethod
+    def matches(entry: dict) -> bool:
+        """Whether none of the files the session refers to changed since it was recorded"""
+        return fingerprint(entry["argv"], entry["cwd"]) == entry["fingerprint"]
+
+
+journal = RecentSessions()
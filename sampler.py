@@ -0,0 +1,134 @@
+import json
+import os
+import os.path
+import threading
+import time
+
+import library
+
+USAGE_FILE = library.CACHE_DIR + "/sessions.jsonl"
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+# /proc/<pid>/status lines we keep, with the name they get in the record
+STATUS_FIELDS = {
+    "VmHWM": "peak_rss_kb", "VmRSS": "rss_kb",
+    "voluntary_ctxt_switches": "voluntary_switches", "nonvoluntary_ctxt_switches": "involuntary_switches"
+}
+IO_FIELDS = ("rchar", "wchar", "read_bytes", "write_bytes")
+
+_records_lock = threading.Lock()
+# the sampler threads still running, a program that exits before the engine joins them first
+_threads = set()
+_threads_lock = threading.Lock()
+
+
+def available() -> bool:
+    return os.path.exists("/proc/self/stat")
+
+
+def join_all():
+    """Wait until every session being sampled has exited and its record is written"""
+    with _threads_lock:
+        threads = list(_threads)
+    for thread in threads:
+        thread.join()
+
+
+def read_stat(pid: int) -> dict:
+    with open("/proc/{}/stat".format(pid)) as stat:
+        # the process name can contain spaces and parentheses, the fields after it can't
+        fields = stat.read().rsplit(")", 1)[1].split()
+    # fields[0] is the third field of the file, the process state
+    return {
+        "cpu_user_s": int(fields[11]) / CLOCK_TICKS, "cpu_system_s": int(fields[12]) / CLOCK_TICKS,
+        "threads": int(fields[17])
+    }
+
+
+def read_status(pid: int) -> dict:
+    usage = {}
+    with open("/proc/{}/status".format(pid)) as status:
+        for line in status:
+            key, _, value = line.partition(":")
+            if key in STATUS_FIELDS:
+                usage[STATUS_FIELDS[key]] = int(value.split()[0])
+    return usage
+
+
+def read_io(pid: int) -> dict:
+    usage = {}
+    with open("/proc/{}/io".format(pid)) as io:
+        for line in io:
+            key, _, value = line.partition(":")
+            if key in IO_FIELDS:
+                usage[key] = int(value)
+    return usage
+
+
+def sample(pid: int) -> dict:
+    usage = read_stat(pid)
+    usage.update(read_status(pid))
+    try:
+        usage.update(read_io(pid))
+    except OSError:
+        # some kernels only show io to processes that may ptrace the engine
+        pass
+    return usage
+
+
+def append_record(record: dict, usage_file=USAGE_FILE):
+    folder = os.path.dirname(usage_file)
+    with _records_lock:
+        if bool(folder) and not os.path.exists(folder):
+            os.makedirs(folder)
+        with open(usage_file, "a") as records:
+            records.write(json.dumps(record) + "\n")
+
+
+class UsageSampler(object):
+    """Poll /proc for an engine process on a thread until it exits, then append the totals together with
+    the settings it was started with to the session records, one JSON object per line"""
+
+    def __init__(self, current, settings: dict, interval_ms=500, usage_file=USAGE_FILE):
+        self.__current = current
+        self.__settings = settings
+        self.__interval = max(interval_ms, 10) / 1000
+        self.__usage_file = usage_file
+        self.record = None
+
+    def start(self):
+        # a daemon, closing the launcher mustn't wait for the engine to exit. The CLI joins it
+        thread = threading.Thread(target=self.__run, daemon=True)
+        with _threads_lock:
+            _threads.add(thread)
+        thread.start()
+
+    def __run(self):
+        usage = {}
+        samples = 0
+        while self.__current.process.poll() is None:
+            try:
+                latest = sample(self.__current.pid)
+            except (OSError, ValueError, IndexError):
+                # the process went away between the check and the reads
+                break
+            if self.__current.process.poll() is not None:
+                # it exited during the reads, /proc showed a zombie or another process with its pid
+                break
+            # the kernel keeps a peak too, but only while the process exists
+            latest["peak_rss_kb"] = max(
+                usage.get("peak_rss_kb", 0), latest.get("peak_rss_kb", 0), latest.get("rss_kb", 0)
+            )
+            usage.update(latest)
+            samples += 1
+            time.sleep(self.__interval)
+        exit_code = self.__current.process.wait()
+        usage.pop("rss_kb", None)
+        self.record = {
+            "pid": self.__current.pid, "cmdline": self.__current.cmdline, "start_time": self.__current.start_time,
+            "duration_s": round(time.time() - self.__current.start_time, 3), "exit_code": exit_code,
+            "samples": samples, "interval_ms": int(self.__interval * 1000), "settings": self.__settings
+        }
+        self.record.update(usage)
+        append_record(self.record, self.__usage_file)
+        with _threads_lock:
+            _threads.discard(threading.current_thread())
@@ -0,0 +1,208 @@
+import array
+import collections
+import concurrent.futures as cf
+import os.path
+import re
+import threading
+
+import library
+
+SEARCH_INDEX_FILE = library.CACHE_DIR + "/search.json"
+DESCRIPTION_FIELDS = ("title", "author", "description")
+TXT_READ_SIZE = 64 * 1024
+# "Title                   : Some WAD", continuation lines are indented
+TXT_FIELD = re.compile(r"^([A-Za-z][A-Za-z ]*?)\s*:\s?(.*)$")
+
+
+def read_description(path: str) -> dict:
+    """Return the title, author and description from an idgames .txt file"""
+    with open(path, encoding="latin-1") as txt:
+        lines = txt.read(TXT_READ_SIZE).splitlines()
+    fields = {}
+    current = None
+    for line in lines:
+        found = TXT_FIELD.match(line)
+        if found is not None:
+            current = found.group(1).strip().lower()
+            if current in DESCRIPTION_FIELDS and current not in fields:
+                fields[current] = found.group(2).strip()
+            else:
+                current = None
+        elif current is not None and line[:1].isspace() and bool(line.strip()):
+            fields[current] += " " + line.strip()
+        else:
+            current = None
+    return fields
+
+
+def description_file(path: str, snapshot=None):
+    """Return the .txt file that comes with the file, or None. snapshot is the
+    library.index.snapshot() of its folder if the caller already has it"""
+    folder, name = os.path.split(path)
+    snapshot = library.index.snapshot(folder or ".") if snapshot is None else snapshot
+    found = snapshot.get(os.path.splitext(name)[0].lower() + ".txt")
+    return os.path.join(folder, found) if found is not None else None
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def trigrams(text: str) -> set:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex(object):
+    """Search over the names of the files in the library and the title, author and description
+    in the idgames .txt file that comes with each of them. Every distinct word gets a list of the
+    files it appears in, and a trigram index over the words finds the ones that contain a query
+    word. Only new or changed files are read again, the texts are kept in inis/search.json"""
+
+    VERSION = 1
+
+    def __init__(self, cache_file=SEARCH_INDEX_FILE):
+        self.__cache_file = cache_file
+        self.__lock = threading.RLock()
+        self.__docs = None
+        self.__dirty = False
+        # files are numbered in the order they were added, a changed file gets a new number
+        self.__ids = {}
+        self.__paths = []
+        self.__dead = 0
+        self.__terms = {}
+        self.__term_words = []
+        self.__term_docs = []
+        self.__grams = collections.defaultdict(lambda: array.array("I"))
+        self.__pool = None
+
+    def __load(self):
+        if self.__docs is None:
+            self.__docs = library.read_json(self.__cache_file, self.VERSION, {})
+            for path, (stamp, text) in self.__docs.items():
+                self.__add(path, text)
+
+    def __add(self, path: str, text: str):
+        doc = len(self.__paths)
+        self.__ids[path] = doc
+        self.__paths.append(path)
+        for word in set(text.split()):
+            term = self.__terms.get(word)
+            if term is None:
+                term = len(self.__term_words)
+                self.__terms[word] = term
+                self.__term_words.append(word)
+                self.__term_docs.append(array.array("I"))
+                for gram in trigrams(word):
+                    self.__grams[gram].append(term)
+            self.__term_docs[term].append(doc)
+
+    def __drop(self, path: str):
+        doc = self.__ids.pop(path, None)
+        if doc is not None:
+            self.__paths[doc] = None
+            self.__dead += 1
+
+    def __compact(self):
+        """Renumber the files once most of the numbers belong to dropped ones"""
+        if self.__dead > len(self.__ids):
+            self.__ids, self.__paths, self.__dead = {}, [], 0
+            self.__terms, self.__term_words, self.__term_docs = {}, [], []
+            self.__grams.clear()
+            for path, (stamp, text) in self.__docs.items():
+                self.__add(path, text)
+
+    def __matching_terms(self, word: str) -> list:
+        if len(word) < 3:
+            # too short for a trigram, the list of distinct words is still much shorter than the file list
+            return [term for term, known in enumerate(self.__term_words) if word in known]
+        rarest = min((self.__grams.get(gram, ()) for gram in trigrams(word)), key=len)
+        return [term for term in rarest if word in self.__term_words[term]]
+
+    @staticmethod
+    def __stamp(path: str, entries: dict, snapshot: dict):
+        """Size and mtime of the file and of its .txt, taken from the library index entries of its folder"""
+        name = os.path.basename(path)
+        if name not in entries:
+            return None, None
+        txt = description_file(path, snapshot)
+        txt_stamp = entries[os.path.basename(txt)][:2] if txt is not None else None
+        return [entries[name][0], entries[name][1], txt_stamp], txt
+
+    def update(self, paths: list):
+        """Index the files that are new or changed since they were last indexed"""
+        # every folder is looked up once, not once for each of its files
+        folders = collections.OrderedDict()
+        for path in paths:
+            path = os.path.abspath(path)
+            folders.setdefault(os.path.dirname(path), []).append(path)
+        for folder, members in folders.items():
+            entries, snapshot = library.index.entries(folder), library.index.snapshot(folder)
+            for path in members:
+                self.__index_file(path, *self.__stamp(path, entries, snapshot))
+        with self.__lock:
+            self.__compact()
+        self.save()
+
+    def __index_file(self, path: str, stamp, txt):
+        with self.__lock:
+            self.__load()
+            if stamp is None or (path in self.__docs and self.__docs[path][0] == stamp):
+                return
+        fields = {}
+        if txt is not None:
+            try:
+                fields = read_description(txt)
+            except OSError:
+                pass
+        text = normalize(" ".join([os.path.basename(path)] + [fields.get(key, "") for key in DESCRIPTION_FIELDS]))
+        with self.__lock:
+            self.__drop(path)
+            self.__add(path, text)
+            self.__docs[path] = [stamp, text]
+            self.__dirty = True
+
+    def prune(self, keep):
+        """Forget every file that isn't in keep, a set of absolute paths"""
+        with self.__lock:
+            self.__load()
+            for path in [path for path in self.__docs if path not in keep]:
+                self.__drop(path)
+                del self.__docs[path]
+                self.__dirty = True
+            self.__compact()
+        self.save()
+
+    def submit(self, paths: list, keep=None) -> cf.Future:
+        """Update the index in the background, pruning it to keep afterwards if that's given"""
+        if self.__pool is None:
+            # one worker, so the updates are applied in the order they were submitted
+            self.__pool = cf.ThreadPoolExecutor(max_workers=1)
+        future = self.__pool.submit(self.update, paths)
+        if keep is not None:
+            self.__pool.submit(self.prune, keep)
+        return future
+
+    def search(self, query: str) -> set:
+        """Return the absolute paths of the files whose name or description contains every word of the query"""
+        found = None
+        with self.__lock:
+            self.__load()
+            for word in normalize(query).split():
+                docs = set()
+                for term in self.__matching_terms(word):
+                    docs.update(self.__term_docs[term])
+                found = docs if found is None else found & docs
+                if not bool(found):
+                    break
+            if found is None:
+                found = self.__ids.values()
+            return {self.__paths[doc] for doc in found if self.__paths[doc] is not None}
+
+    def save(self):
+        with self.__lock:
+            if self.__dirty:
+                library.write_json(self.__cache_file, {"version": self.VERSION, "data": self.__docs})
+                self.__dirty = False
+
+
+index = SearchIndex()
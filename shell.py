@@ -1,8 +1,23 @@
+import atexit
 import collections
 import configparser as cp
+import itertools
+import json
 import os
 import os.path
+import queue
+import shlex
+import shutil
 import subprocess
+import tempfile
+import threading
+import time
+
+import library
+import tracing
+
+# archives, iwads, recent, sampler, validation and logging are imported where they're used:
+# the command line starts without zipfile, hashlib, the thread pools and the logging machinery
 
 # Global constants
 WIDTH_MIN = 300
@@ -12,6 +27,18 @@ HEIGHT_MIN = 200
 HEIGHT_DEF = 600
 GL_HEIGHT_DEF = 768
 
+LOG_LINES = 2000
+LOG_FILE_BYTES = 1 << 20
+LOG_FILE_BACKUPS = 3
+ENGINE_LOG_FILE = "./inis/engine.log"
+# longer argument vectors are passed in a response file, well below the 8191 characters cmd.exe takes
+RESPONSE_FILE_THRESHOLD = 8000
+RESPONSE_FOLDER_PREFIX = "prboom-launcher-"
+# the load order lists archive members as "archive.zip/MEMBER.WAD"
+ARCHIVE_MEMBER_MARKS = (".zip/", ".pk3/")
+# the engine reads its response file as it starts, older folders were left behind by a launcher that exited first
+STALE_RESPONSE_AGE = 3600
+
 ULTIMATE = "ultimate"
 DOOM2 = "doom2"
 PLUTONIA = "plutonia"
@@ -65,15 +92,187 @@ level_lists = {
     PLUTONIA: doom2_levels, TNT: doom2_levels, NRFTL: doom2_levels[1:10]
 }
 
+release_iwads = {
+    ULTIMATE: "DOOM.WAD", DOOM2: "DOOM2.WAD", PLUTONIA: "PLUTONIA.WAD",
+    TNT: "TNT.WAD", NRFTL: "DOOM2.WAD", MASTER: "DOOM2.WAD"
+}
+
 
 # convert single-number level destinations to Ultimate Doom two-number format
 def calculate_ultdoom_warp(i: int) -> tuple:
     return (0, 0) if i == 0 else ((i - 1) // 9 + 1, (i - 1) % 9 + 1)
 
 
-def wrap(paths: list):
-    wrapped = ['"{}"'.format(path) for path in paths]
-    return ' '.join(wrapped)
+def unique_paths(paths) -> list:
+    """Drop empty and repeated folders, keeping the first spelling of each one"""
+    unique = collections.OrderedDict()
+    for path in paths:
+        if bool(path):
+            unique.setdefault(os.path.normcase(os.path.abspath(path)), path)
+    return list(unique.values())
+
+
+def pwad_path(name: str) -> str:
+    """Files in the load order are relative to the PWAD folder, unless they come from another search root"""
+    return name if os.path.isabs(name) else "{}/{}".format(Shell.pwadpath, name)
+
+
+def load_paths(names: list) -> list:
+    """Return the files the engine loads for the files in the load order, archive members are extracted first"""
+    paths = [pwad_path(name) for name in names]
+    if not any(mark in path.lower() for path in paths for mark in ARCHIVE_MEMBER_MARKS):
+        return paths
+    import archives
+    try:
+        return archives.cache.extract_all(paths, Shell.archive_cache_mb)
+    except OSError as error:
+        print("Can't extract {}".format(error))
+        return paths
+
+
+def tnt_patch() -> list:
+    """The TNT.WAD patch if it's there, it isn't required to play"""
+    import validation
+    patch = "{}/{}".format(Shell.iwadpath, "tnt31.wad")
+    return [patch] if validation.validator.exists(patch) else []
+
+
+def nrftl_file() -> str:
+    return "{}/{}".format(Shell.nrftlpath, "NERVE.WAD")
+
+
+def master_level_file(level_index: int) -> str:
+    # handle special case of TEETH2 located in the same file as TEETH
+    level = master_levels[level_index] if level_index != 17 else "TEETH"
+    return "{}/{}".format(Shell.mlpath, level + ".WAD")
+
+
+def locate_iwad(iwad_name: str) -> tuple:
+    """Return (path, release) of the IWAD, digests that aren't cached yet are hashed in the background.
+    Only the IWAD folder is searched by contents, the other roots hold the PWAD library"""
+    import iwads
+    return iwads.identifier.locate(Shell.iwad_roots(), iwad_name, wait=False, content_folders=[Shell.iwadpath])
+
+
+def release_files(game: str) -> list:
+    """The files an official release can't start without, the Master Levels files are checked per level"""
+    files = [locate_iwad(release_iwads[game])[0]]
+    if game == NRFTL:
+        files.append(nrftl_file())
+    return files
+
+
+def split_cmds(cmds: str) -> list:
+    """Split the custom parameters typed by the user into arguments, Windows paths keep their backslashes"""
+    if os.name != "nt":
+        return shlex.split(cmds)
+    return [arg[1:-1] if len(arg) > 1 and arg[0] == arg[-1] == '"' else arg for arg in shlex.split(cmds, posix=False)]
+
+
+def format_cmdline(argv: list) -> str:
+    """The command line as it would be typed into the system's shell"""
+    return subprocess.list2cmdline(argv) if os.name == "nt" else ' '.join(shlex.quote(arg) for arg in argv)
+
+
+def write_response_file(args: list):
+    """Put the arguments into a response file in a new temporary folder, returns (folder, file).
+    The engine drops every quote it reads there and knows no escapes, so arguments containing
+    quotes can't be passed this way"""
+    if any('"' in arg for arg in args):
+        raise ValueError("quotes can't be passed in a response file")
+    folder = tempfile.mkdtemp(prefix=RESPONSE_FOLDER_PREFIX)
+    response_file = os.path.join(folder, "args.rsp")
+    with open(response_file, "w") as response:
+        for arg in args:
+            response.write('"{}"\n'.format(arg) if any(c.isspace() for c in arg) else arg + "\n")
+    return folder, response_file
+
+
+def remove_stale_response_files():
+    """Delete the response file folders of sessions started long ago, their cleanup
+    only runs while the launcher that started them is still there when they exit"""
+    if library.read_only:
+        return
+    limit = time.time() - STALE_RESPONSE_AGE
+    try:
+        with os.scandir(tempfile.gettempdir()) as entries:
+            stale = [
+                entry.path for entry in entries if entry.name.startswith(RESPONSE_FOLDER_PREFIX)
+                and entry.is_dir(follow_symlinks=False) and entry.stat().st_mtime < limit
+            ]
+    except OSError:
+        return
+    for folder in stale:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+class LoadOrder(object):
+    """Ordered set of file names with O(1) membership and index lookups.
+    Files keep the order they were added in, adding a file twice does nothing"""
+
+    def __init__(self, files=()):
+        self.__items = collections.OrderedDict()
+        self.__positions = {}
+        self.__order = []
+        self.extend(files)
+
+    def __contains__(self, item) -> bool:
+        return item in self.__items
+
+    def __iter__(self):
+        return iter(self.__items)
+
+    def __len__(self) -> int:
+        return len(self.__items)
+
+    def __eq__(self, other) -> bool:
+        return list(self) == list(other)
+
+    def __repr__(self) -> str:
+        return "LoadOrder({})".format(list(self))
+
+    def __getitem__(self, index: int):
+        return self.__ordered()[index]
+
+    def __ordered(self) -> list:
+        if self.__order is None:
+            self.__order = list(self.__items)
+        return self.__order
+
+    def as_list(self) -> list:
+        return list(self.__ordered())
+
+    def append(self, item):
+        if item not in self.__items:
+            if self.__positions is not None:
+                self.__positions[item] = len(self.__items)
+            if self.__order is not None:
+                self.__order.append(item)
+            self.__items[item] = None
+
+    def extend(self, items):
+        for item in items:
+            self.append(item)
+
+    def discard(self, item):
+        if self.__items.pop(item, False) is None:
+            self.__positions = None
+            self.__order = None
+
+    def retain(self, keep):
+        """Drop every file that isn't in keep, which should support fast membership tests"""
+        self.__items = collections.OrderedDict((item, None) for item in self.__items if item in keep)
+        self.__positions = None
+        self.__order = None
+
+    def index(self, item) -> int:
+        if self.__positions is None:
+            # positions after a removal are rebuilt once, lookups stay O(1) until the next one
+            self.__positions = {name: i for i, name in enumerate(self.__items)}
+        try:
+            return self.__positions[item]
+        except KeyError:
+            raise ValueError("{} is not in the load order".format(item))
 
 
 class BaseShell(object):
@@ -110,6 +309,11 @@ class Shell(BaseShell):
     pwadpath = "."
     savepath = "./saves"
     demopath = "."
+    wadpaths = ""   # additional folders to search for WADs, separated by ";"
+    archive_cache_mb = 1024   # size budget of the files extracted from .zip and .pk3 archives
+    sample_usage = False   # whether to record the CPU, memory and I/O use of every session
+    sample_interval_ms = 500
+    log_engine_output = False   # whether to keep the engine's output in a log file
     make_savedirs = True   # whether to autogenerate save file subfolders for each specific game/mod combination
 
     prboom = "prboom-plus"  # software renderer executable
@@ -127,9 +331,13 @@ class Shell(BaseShell):
     fsdesktop = True
     conf = ""
 
+    state_fields = ("game", "skill_index", "level_index")
+
     def __init__(self):
         super().__init__()
         self.game = ULTIMATE
+        # why the last game couldn't be started
+        self.problems = []
 
     @property
     def game(self) -> str:
@@ -151,6 +359,11 @@ class Shell(BaseShell):
             "pwadpath": ".",
             "savepath": "./saves",
             "demopath": ".",
+            "wadpaths": "",
+            "archive_cache_mb": 1024,
+            "sample_usage": False,
+            "sample_interval_ms": 500,
+            "log_engine_output": False,
             "make_savedirs": True,
             "opengl": False,
             "res_x": WIDTH_DEF,
@@ -165,19 +378,68 @@ class Shell(BaseShell):
         for default in defaults:
             setattr(cls, default, defaults[default])
 
-    def start_game(self):
+    @classmethod
+    def search_roots(cls) -> list:
+        """Ordered PWAD search roots: the PWAD folder, the additional folders, DOOMWADDIR and DOOMWADPATH"""
+        roots = [cls.pwadpath] + cls.wadpaths.split(';') + [os.environ.get("DOOMWADDIR", "")]
+        roots.extend(os.environ.get("DOOMWADPATH", "").split(os.pathsep))
+        return unique_paths(roots)
+
+    @classmethod
+    def excluded_folders(cls) -> list:
+        """The launcher's own folders, the saves, the caches with the extracted archive members
+        and the Master Levels aren't PWADs to list even when they're inside a search root"""
+        return [cls.savepath, library.CACHE_DIR, cls.mlpath]
+
+    @classmethod
+    def iwad_roots(cls) -> list:
+        return unique_paths([cls.iwadpath] + cls.search_roots())
+
+    @tracing.traced("start game")
+    def start_game(self, procmgr=None):
         game_sessions = {
             ULTIMATE: UltimateSession, DOOM2: GameSession, PLUTONIA: PlutoniaSession,
             TNT: TNTSession, NRFTL: NRFTLSession, MASTER: MLSession
         }
         current = game_sessions[self.game]()
         current.launch_params(self.skill_index, self.level_index)
-        current.launch()
+        return self._launch(current, procmgr)
+
+    def _launch(self, current, procmgr):
+        started = current.launch(procmgr)
+        self.problems = current.problems
+        if started is not None:
+            import recent
+            recent.journal.record(
+                self.title(), current.argv, os.getcwd(), current.savedir, current.settings,
+                isinstance(self, ShellCustom), self.state()
+            )
+        return started
+
+    def title(self) -> str:
+        """What the recent sessions list calls the game"""
+        levels = level_lists[self.game]
+        level = levels[self.level_index] if self.level_index < len(levels) else "level {}".format(self.level_index)
+        return "{} {}".format(games[self.game], level)
+
+    def state(self) -> dict:
+        """The choices the game is started from, restore() makes a manager start the same game"""
+        return {field: getattr(self, field) for field in self.state_fields}
+
+    def restore(self, state: dict):
+        for field, value in state.items():
+            if field in self.state_fields:
+                setattr(self, field, value)
 
 
 class ShellCustom(Shell):
     """Store settings for custom game sessions"""
 
+    state_fields = (
+        "iwad_index", "comp_index", "skill_index", "level_index", "fast", "respawn", "cmdline",
+        "demorec", "demorec_name", "demoplay", "demoplay_name", "files"
+    )
+
     def __init__(self):
         super().__init__()
         self.comp_index = 0
@@ -192,12 +454,12 @@ class ShellCustom(Shell):
         self.demoplay_name = ""
 
     @property
-    def files(self) -> list:
+    def files(self) -> LoadOrder:
         return self.__files
 
     @files.setter
-    def files(self, files: list):
-        self.__files = files
+    def files(self, files):
+        self.__files = files if isinstance(files, LoadOrder) else LoadOrder(files)
 
     @property
     def iwad_index(self) -> int:
@@ -217,27 +479,249 @@ class ShellCustom(Shell):
         if 0 <= index < len(compat_list):
             self.__comp_index = index
 
-    def start_game(self):
+    def title(self) -> str:
+        names = [os.path.basename(file) for file in self.files]
+        game = "{} {}".format(iwad_list[self.iwad_index], ' '.join(names) if bool(names) else "custom game")
+        if self.demoplay and not self.demorec:
+            return "{}, demo {}".format(game, os.path.basename(self.demoplay_name))
+        return game
+
+    def state(self) -> dict:
+        state = super().state()
+        state["files"] = self.files.as_list()
+        return state
+
+    @tracing.traced("start custom game")
+    def start_game(self, procmgr=None):
         if self.demoplay and not self.demorec:
             current = DemoSession(
                 self.iwad_index, self.comp_index, self.files,
                 self.fast, self.respawn, self.cmdline, self.demoplay_name, True
             )
             # Don't pass the options for skill and level destination when playing a demo
-            current.launch()
+            return self._launch(current, procmgr)
         elif self.demorec and not self.demoplay:
             current = DemoSession(
                 self.iwad_index, self.comp_index, self.files,
                 self.fast, self.respawn, self.cmdline, self.demorec_name, False
             )
             current.launch_params(self.skill_index, self.level_index)
-            current.launch()
+            return self._launch(current, procmgr)
         else:
             current = CustomSession(
                 self.iwad_index, self.comp_index, self.files, self.fast, self.respawn, self.cmdline
             )
             current.launch_params(self.skill_index, self.level_index)
-            current.launch()
+            return self._launch(current, procmgr)
+
+
+def relaunch(entry: dict, procmgr=None):
+    """Start a recent session again, returns (its SessionProcess or None, problems). The recorded command line
+    is reused as it is while none of its files changed, otherwise the game is set up again from the choices
+    it was started with"""
+    import recent
+    if recent.journal.matches(entry):
+        print(format_cmdline(entry["argv"]))
+        savedir = os.path.join(entry["cwd"], entry["savedir"]) if bool(entry["savedir"]) else ""
+        current = spawn_argv(entry["argv"], savedir, entry["settings"], procmgr, cwd=entry["cwd"])
+        if current is not None:
+            recent.journal.touch(entry)
+        return current, []
+    print("The files of {} changed since it was started, setting it up again".format(entry["title"]))
+    gamemgr = ShellCustom() if entry["custom"] else Shell()
+    gamemgr.restore(entry["state"])
+    return gamemgr.start_game(procmgr), gamemgr.problems
+
+
+class SessionProcess(object):
+    """A single engine process started by ProcessManager"""
+
+    def __init__(self, process: subprocess.Popen, cmdline: str):
+        self.process = process
+        self.pid = process.pid
+        self.cmdline = cmdline
+        self.start_time = time.time()
+        self.end_time = None
+        self.exit_code = None
+
+    @property
+    def running(self) -> bool:
+        return self.exit_code is None
+
+
+class OutputLog(object):
+    """The last lines the engines wrote to stdout and stderr, shared by all sessions. Appending never
+    blocks on the disk: the optional rotating log file is written by a listener thread"""
+
+    def __init__(self, size=LOG_LINES):
+        self.__lines = collections.deque(maxlen=size)
+        self.__count = 0
+        self.__lock = threading.Lock()
+        self.__log_file = None
+        self.__records = None
+        self.__listener = None
+
+    def append(self, pid: int, stream: str, line: str):
+        with self.__lock:
+            self.__lines.append((pid, stream, line))
+            self.__count += 1
+            # set_log_file() may swap the queue out from another thread
+            records = self.__records
+        if records is not None:
+            import logging
+            records.put_nowait(logging.makeLogRecord({"msg": "[{}] {}: {}".format(pid, stream, line)}))
+
+    def since(self, count: int):
+        """Return the number of lines appended so far and the ones appended after count that are still kept"""
+        with self.__lock:
+            new = min(self.__count - count, len(self.__lines))
+            return self.__count, list(itertools.islice(self.__lines, len(self.__lines) - new, None))
+
+    def set_log_file(self, log_file):
+        """Also write the lines to a rotating log file, or stop doing that if log_file is None"""
+        if log_file == self.__log_file:
+            return
+        if self.__listener is not None:
+            with self.__lock:
+                self.__records = None
+            self.__listener.stop()
+            for handler in self.__listener.handlers:
+                handler.close()
+            self.__listener = None
+        elif log_file is not None:
+            # the listener has to flush the last lines before the program ends
+            atexit.register(self.set_log_file, None)
+        self.__log_file = log_file
+        if log_file is not None:
+            import logging.handlers
+            folder = os.path.dirname(log_file)
+            if bool(folder) and not os.path.exists(folder):
+                os.makedirs(folder)
+            handler = logging.handlers.RotatingFileHandler(
+                log_file, maxBytes=LOG_FILE_BYTES, backupCount=LOG_FILE_BACKUPS, encoding="utf-8"
+            )
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            records = queue.Queue()
+            self.__listener = logging.handlers.QueueListener(records, handler)
+            self.__listener.start()
+            with self.__lock:
+                self.__records = records
+
+
+class DryRunManager(object):
+    """Stands in for ProcessManager when the command line only has to be printed"""
+
+    def spawn(self, cmdline, on_exit=None, **popen_args):
+        return None
+
+
+class ProcessManager(object):
+    """Start engine processes without blocking the caller and keep a table of them.
+    Every process gets a watcher thread that waits for it and queues it up on exit,
+    the GUI picks finished sessions with poll_exits()"""
+
+    def __init__(self, output_log=None):
+        self.__table = collections.OrderedDict()
+        self.__lock = threading.Lock()
+        self.__exited = queue.Queue()
+        self.__output_log = output_log
+
+    def spawn(self, cmdline, on_exit=None, **popen_args) -> SessionProcess:
+        # command lines are assembled for Windows, elsewhere Popen needs them split up
+        args = shlex.split(cmdline) if isinstance(cmdline, str) and os.name != "nt" else cmdline
+        # the output goes to the log unless the caller wants it for itself
+        capture = self.__output_log is not None and "stdout" not in popen_args and "stderr" not in popen_args
+        if capture:
+            popen_args.update(stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        with tracing.tracer.span("spawn"):
+            started = tracing.clock_ns()
+            current = SessionProcess(subprocess.Popen(args, **popen_args), cmdline)
+        with self.__lock:
+            self.__table[current.pid] = current
+        watcher = threading.Thread(target=self.__watch, args=(current, on_exit, started), daemon=True)
+        watcher.start()
+        if capture:
+            for stream, pipe in (("stdout", current.process.stdout), ("stderr", current.process.stderr)):
+                # not daemons: an engine writing to a pipe nobody reads anymore would be killed by SIGPIPE
+                threading.Thread(target=self.__read_output, args=(current.pid, stream, pipe)).start()
+        return current
+
+    def __read_output(self, pid: int, stream: str, pipe):
+        with pipe:
+            for line in iter(pipe.readline, b""):
+                self.__output_log.append(pid, stream, line.decode(errors="replace").rstrip())
+
+    def __watch(self, current: SessionProcess, on_exit, started: int):
+        exit_code = current.process.wait()
+        with self.__lock:
+            current.end_time = time.time()
+            current.exit_code = exit_code
+        tracing.tracer.complete("engine", started, tracing.clock_ns(), pid=current.pid, exit_code=exit_code)
+        tracing.tracer.save()
+        if on_exit is not None:
+            on_exit(current)
+        self.__exited.put(current)
+
+    def poll_exits(self) -> list:
+        """Return the sessions that exited since the last call"""
+        exited = []
+        while True:
+            try:
+                exited.append(self.__exited.get_nowait())
+            except queue.Empty:
+                return exited
+
+    def running(self) -> list:
+        with self.__lock:
+            return [current for current in self.__table.values() if current.running]
+
+    def table(self) -> list:
+        with self.__lock:
+            return list(self.__table.values())
+
+    def wait_all(self, timeout=None):
+        for current in self.running():
+            try:
+                current.process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                pass
+
+
+# all the sessions launched by this program go through a single process table and output log
+engine_log = OutputLog()
+processes = ProcessManager(engine_log)
+
+
+def spawn_argv(argv: list, savedir: str, settings: dict, procmgr=None, **popen_args):
+    """Spawn an argument vector that is known to be good, return its SessionProcess or None"""
+    procmgr = processes if procmgr is None else procmgr
+    if library.read_only:
+        # a dry run, no save folder, log or response file is made for it
+        return procmgr.spawn(argv, **popen_args)
+    if bool(savedir) and not os.path.exists(savedir):
+        os.makedirs(savedir)
+    engine_log.set_log_file(ENGINE_LOG_FILE if Shell.log_engine_output else None)
+    response_folder = None
+    # too long for some systems, the engine reads the arguments from the file instead.
+    # Quotes only get there on systems that allow them in file names, those take long command lines
+    if sum(len(arg) + 3 for arg in argv) > RESPONSE_FILE_THRESHOLD and not any('"' in arg for arg in argv):
+        response_folder, response_file = write_response_file(argv[1:])
+        argv = [argv[0], "@" + response_file]
+    cleanup = (lambda done: shutil.rmtree(response_folder, ignore_errors=True)) if bool(response_folder) else None
+    try:
+        current = procmgr.spawn(argv, on_exit=cleanup, **popen_args)
+    except OSError as err:
+        print(err)
+        current = None
+    if current is None:
+        if cleanup is not None:
+            cleanup(None)
+        return None
+    if Shell.sample_usage:
+        import sampler
+        if sampler.available():
+            sampler.UsageSampler(current, settings, Shell.sample_interval_ms).start()
+    return current
 
 
 class Session(object):
@@ -249,36 +733,50 @@ class Session(object):
             res_x: int, res_y: int, fsdesktop=True
     ):
         self._cmd_args = {}
+        self.argv = []
+        self.problems = []
         self.__exe = exe_name
         self.__savedir = ""
+        # what the session records are compared by
+        self.__settings = {
+            "exe": exe_name, "opengl": Shell.opengl, "fullscreen": fullscreen, "res_x": res_x, "res_y": res_y
+        }
         self._arg_conf(conf)
         self._arg_fullscreen(fullscreen)
         self._arg_fsdesktop(fsdesktop)
         self._arg_res(res_x, res_y)
 
+    @property
+    def savedir(self) -> str:
+        return self.__savedir
+
+    @property
+    def settings(self) -> dict:
+        return self.__settings
+
     def _arg_conf(self, conf: str):
         if bool(conf):
-            self._cmd_args["conf"] = '{} "{}"'.format("-config", conf)
+            self._cmd_args["conf"] = ["-config", conf]
         else:
             self._cmd_args.pop("conf", None)
 
     def _arg_fullscreen(self, fullscreen: bool):
-        self._cmd_args["fullscr"] = "-fullscreen" if fullscreen else "-window"
+        self._cmd_args["fullscr"] = ["-fullscreen" if fullscreen else "-window"]
 
     def _arg_fsdesktop(self, fsdesktop: bool):
         if fsdesktop:
-            self._cmd_args["fsdt"] = "-fsdesktop"
+            self._cmd_args["fsdt"] = ["-fsdesktop"]
         else:
             self._cmd_args.pop("fsdt", None)
 
     def _arg_res(self, res_x: int, res_y: int):
         if 299 < res_x < 8000 and 199 < res_y < 4500:
-            self._cmd_args["x"] = "-width " + str(res_x)
-            self._cmd_args["y"] = "-height " + str(res_y)
+            self._cmd_args["x"] = ["-width", str(res_x)]
+            self._cmd_args["y"] = ["-height", str(res_y)]
 
     def _arg_savedir(self, savedir: str):
         if bool(savedir):
-            self._cmd_args["savedir"] = '{} "{}"'.format("-save", savedir)
+            self._cmd_args["savedir"] = ["-save", savedir]
             self.__savedir = savedir
         else:
             self._cmd_args.pop("savedir", None)
@@ -286,88 +784,102 @@ class Session(object):
 
     def _arg_comp(self, comp: int):
         if bool(comp):
-            self._cmd_args["comp"] = "-complevel " + str(comp)
+            self._cmd_args["comp"] = ["-complevel", str(comp)]
         else:
             self._cmd_args.pop("comp", None)
 
     def _arg_fast(self, fast: bool):
         if fast:
-            self._cmd_args["fast"] = "-fast"
+            self._cmd_args["fast"] = ["-fast"]
         else:
             self._cmd_args.pop("fast", None)
 
     def _arg_respawn(self, resp: bool):
         if resp:
-            self._cmd_args["respawn"] = "-respawn"
+            self._cmd_args["respawn"] = ["-respawn"]
         else:
             self._cmd_args.pop("respawn", None)
 
     def _arg_warp(self, warp: tuple):
         if len(warp) > 1 and warp[0] != 0:
-            arg = "-warp " + str(warp[0])
+            args = ["-warp", str(warp[0])]
             if warp[1] != 0:
-                arg += " " + str(warp[1])
-            self._cmd_args["warp"] = arg
+                args.append(str(warp[1]))
+            self._cmd_args["warp"] = args
         else:
             self._cmd_args.pop("warp", None)
 
     def _arg_skill(self, skill: int):
         if 0 < skill < 7:
-            self._cmd_args["skill"] = "-skill " + str(skill)
+            self._cmd_args["skill"] = ["-skill", str(skill)]
 
     def _arg_files(self, files: list):
         if bool(files):
-            self._cmd_args["files"] = "-file " + wrap(files)
+            self._cmd_args["files"] = ["-file"] + list(files)
         else:
             self._cmd_args.pop("files", None)
 
     def _arg_deh(self, deh: str):
         if bool(deh):
-            self._cmd_args["deh"] = '{} "{}"'.format("-deh", deh)
+            self._cmd_args["deh"] = ["-deh", deh]
         else:
             self._cmd_args.pop("deh", None)
 
     def _arg_iwad(self, iwad: str):
-        self._cmd_args["iwad"] = '{} "{}"'.format("-iwad", iwad)
+        self._cmd_args["iwad"] = ["-iwad", iwad]
 
     def _arg_custom_cmds(self, cmds: str):
         if bool(cmds):
-            self._cmd_args["cmds"] = cmds
+            self._cmd_args["cmds"] = split_cmds(cmds)
         else:
             self._cmd_args.pop("cmds", None)
 
     def _arg_playdemo(self, demo: str):
         if bool(demo):
-            self._cmd_args["playdemo"] = '{} "{}"'.format("-playdemo", demo)
+            self._cmd_args["playdemo"] = ["-playdemo", demo]
         else:
             self._cmd_args.pop("playdemo", None)
 
+    def _arg_timedemo(self, demo: str):
+        if bool(demo):
+            self._cmd_args["timedemo"] = ["-timedemo", demo]
+        else:
+            self._cmd_args.pop("timedemo", None)
+
     def _arg_recorddemo(self, demo: str):
         if bool(demo):
-            self._cmd_args["rec"] = '{} "{}"'.format("-record", demo)
+            self._cmd_args["rec"] = ["-record", demo]
         else:
             self._cmd_args.pop("rec", None)
 
-    def _make_cmdline(self):
-        """Assemble a command line starting with the name of an executable"""
-        cmdline = [self._cmd_args[arg] for arg in self._cmd_args]
-        cmdline.insert(0, self.__exe)
-        return ' '.join(cmdline)
-
-    def launch(self):
-        if bool(self.__savedir) and not os.path.exists(self.__savedir):
-            os.makedirs(self.__savedir)
-        print(self._make_cmdline())
-        try:
-            subprocess.call(self._make_cmdline())
-        except FileNotFoundError as err:
-            print(err)
+    @tracing.traced("make argv")
+    def _make_argv(self) -> list:
+        """Assemble the argument vector starting with the name of an executable"""
+        argv = [self.__exe]
+        for args in self._cmd_args.values():
+            argv.extend(args)
+        return argv
+
+    def launch(self, procmgr=None, **popen_args):
+        """Spawn the executable and return its SessionProcess right away, or None if it can't be started,
+        then the reasons are in problems"""
+        argv = self._make_argv()
+        print(format_cmdline(argv))
+        import validation
+        with tracing.tracer.span("validate"):
+            self.problems = validation.validator.validate(argv)
+        if bool(self.problems):
+            for problem in self.problems:
+                print(problem)
+            return None
+        self.argv = argv
+        return spawn_argv(argv, self.__savedir, self.__settings, procmgr, **popen_args)
 
 
 class GameSession(Session):
     """A basic game session, which is also vanilla DOOM2 game session"""
 
-    def __init__(self):
+    def __init__(self, iwad_name="DOOM2.WAD", comp=2):
         if Shell.opengl:
             super().__init__(
                 Shell.glboom, Shell.conf, Shell.gl_fullscreen,
@@ -382,8 +894,21 @@ class GameSession(Session):
             self._arg_savedir(Shell.savepath)
         if Shell.make_savedirs:
             self._arg_savedir("{}/{}".format(Shell.savepath, DOOM2))
-        self._arg_iwad('{}/{}'.format(Shell.iwadpath, "DOOM2.WAD"))
-        self._arg_comp(2)
+        # subclasses name their own IWAD, so it's looked up only once
+        if iwad_name is not None:
+            self._arg_release(iwad_name, comp)
+
+    def _arg_release(self, iwad_name: str, comp: int):
+        """Pass the IWAD found by its contents, with the complevel of the identified release.
+        Only digests that are cached already are used, the others are hashed in the background"""
+        path, release = locate_iwad(iwad_name)
+        self._arg_iwad(path)
+        if release is not None and release.iwad == iwad_name:
+            self._arg_comp(release.complevel)
+        else:
+            if release is not None:
+                print("{} contains {}, not {}".format(path, release.title, iwad_name))
+            self._arg_comp(comp)
 
     def _skill(self, skill_index, level_index=1):
         # Only pass skill setting when we go to a level, NOT to main menu screen
@@ -399,9 +924,7 @@ class UltimateSession(GameSession):
     """Vanilla Ultimate Doom game session"""
 
     def __init__(self):
-        super().__init__()
-        self._arg_iwad('{}/{}'.format(Shell.iwadpath, "DOOM.WAD"))
-        self._arg_comp(3)
+        super().__init__("DOOM.WAD", 3)
         if Shell.make_savedirs:
             self._arg_savedir("{}/{}".format(Shell.savepath, ULTIMATE))
 
@@ -414,9 +937,7 @@ class PlutoniaSession(GameSession):
     """Vanilla Final Doom: Plutonia game session"""
 
     def __init__(self):
-        super().__init__()
-        self._arg_iwad('{}/{}'.format(Shell.iwadpath, "PLUTONIA.WAD"))
-        self._arg_comp(4)
+        super().__init__("PLUTONIA.WAD", 4)
         if Shell.make_savedirs:
             self._arg_savedir("{}/{}".format(Shell.savepath, PLUTONIA))
 
@@ -425,11 +946,9 @@ class TNTSession(GameSession):
     """Vanilla Final Doom: TNT game session"""
 
     def __init__(self):
-        super().__init__()
-        self._arg_iwad('{}/{}'.format(Shell.iwadpath, "TNT.WAD"))
-        self._arg_comp(4)
+        super().__init__("TNT.WAD", 4)
         # Always try to load the patch for TNT.WAD
-        self._arg_files(['{}/{}'.format(Shell.iwadpath, "tnt31.wad")])
+        self._arg_files(tnt_patch())
         if Shell.make_savedirs:
             self._arg_savedir("{}/{}".format(Shell.savepath, TNT))
 
@@ -441,8 +960,7 @@ class NRFTLSession(GameSession):
 
     def __init__(self):
         super().__init__()
-        campaign = '{}/{}'.format(Shell.nrftlpath, "NERVE.WAD")
-        self._arg_files([campaign])
+        self._arg_files([nrftl_file()])
         if Shell.make_savedirs:
             self._arg_savedir("{}/{}".format(Shell.savepath, NRFTL))
 
@@ -469,10 +987,7 @@ class MLSession(GameSession):
 
     def launch_params(self, skill_index, level_index):
         self._skill(skill_index)
-        # handle special case of TEETH2 located in the same file as TEETH
-        level = master_levels[level_index] if level_index != 17 else "TEETH"
-        file = '{}/{}'.format(Shell.mlpath, level + ".WAD")
-        self._arg_files([file])
+        self._arg_files([master_level_file(level_index)])
         self._arg_warp(self.master_warps[level_index])
 
 
@@ -480,23 +995,25 @@ class CustomSession(GameSession):
     """A game session with various customizable options"""
 
     def __init__(self, iwad_index: int, comp_index: int, files: list, fast: bool, resp: bool, cmds: str):
-        super().__init__()
+        super().__init__(iwad_name=None)
         self.__iwadname = iwad_list[iwad_index]
-        self._arg_iwad('{}/{}'.format(Shell.iwadpath, self.__iwadname))
+        # the complevel is the user's choice here, only the file is looked up by its contents
+        self._arg_iwad(locate_iwad(self.__iwadname)[0])
         self.__complevels = (2, 3, 4, 9, 11, 0)
         self._arg_comp(self.__complevels[comp_index])
         self.__savedir = self.__generate_savedir_name(self.__iwadname)
         # always try to load the patch for TNT.WAD
-        self.__files = ['{}/{}'.format(Shell.iwadpath, "tnt31.wad")] if self.__iwadname == "TNT.WAD" else []
+        self.__files = tnt_patch() if self.__iwadname == "TNT.WAD" else []
         if bool(files):
             dehs = [deh for deh in files if ".deh".lower() in deh.lower() or ".bex".lower() in deh.lower()]
-            if bool(dehs):
-                # only add a single dehacked patch
-                self._arg_deh("{}/{}".format(Shell.pwadpath, dehs[0]))
             wads = [file for file in files if file not in dehs]
+            # only add a single dehacked patch
+            loaded = load_paths(dehs[:1] + wads)
+            if bool(dehs):
+                self._arg_deh(loaded.pop(0))
             # generate a name for save folder based on the .WAD files in the load order
             self.__savedir = self.__generate_savedir_name(self.__iwadname, wads)
-            self.__files.extend(["{}/{}".format(Shell.pwadpath, wad) for wad in wads])
+            self.__files.extend(loaded)
         self._arg_files(self.__files)
         if Shell.make_savedirs:
             self._arg_savedir(self.__savedir)
@@ -513,7 +1030,7 @@ class CustomSession(GameSession):
         if wads is None or not bool(wads):
             return "{}/{}_{}".format(Shell.savepath, iwadname.rstrip("wadWAD").rstrip("."), "CustomGame")
         else:
-            wadstring = '_'.join([wadname.rstrip("wadWAD").rstrip(".") for wadname in wads])
+            wadstring = '_'.join([os.path.basename(wadname).rstrip("wadWAD").rstrip(".") for wadname in wads])
             wadstring = wadstring[:32] if len(wadstring) > 32 else wadstring
             return "{}/{}_{}".format(Shell.savepath, iwadname.rstrip("wadWAD").rstrip("."), wadstring)
 
@@ -535,57 +1052,157 @@ class DemoSession(CustomSession):
             self._arg_recorddemo('{}/{}.lmp'.format(Shell.demopath, self.__demofile))
 
 
+class TimedemoSession(CustomSession):
+    """Play a demo back as fast as possible, the engine reports the timing at exit"""
+
+    def __init__(self, iwad_index: int, comp_index: int, files: list, cmds: str, demofile: str):
+        super().__init__(iwad_index, comp_index, files, False, False, cmds)
+        self._arg_savedir("")
+        self._arg_timedemo(demofile)
+
+
 class IniManager(object):
     """Save and load global settings and custom game presets"""
 
     def __init__(self, custommgr: ShellCustom):
         self.INI_DIR = "./inis"
         self.INI_DEFAULT = "launcher.ini"
+        self.INI_JOURNAL = "launcher.journal"
+        self.JOURNAL_COMPACT = 200   # journal entries after which they're folded into the default .ini file
         self.SECT_GLOB = "GlobalSettings"
         self.SECT_CUSTM = "CustomGame"
         self.__custommgr = custommgr
         self.__ini = cp.ConfigParser()
         self.__ini[self.SECT_GLOB] = {}
         self.__ini[self.SECT_CUSTM] = {}
-        if not os.path.exists(self.INI_DIR):
-            os.makedirs(self.INI_DIR)
         self.__default_ini_file = '{}/{}'.format(self.INI_DIR, self.INI_DEFAULT)
+        self.__journal_file = '{}/{}'.format(self.INI_DIR, self.INI_JOURNAL)
+        self.__journal_entries = 0
+        self.__saved = {}   # the settings as they are in the default .ini file plus the journal
 
         self.string_globals = (
             "prboom", "glboom", "iwadpath", "mlpath", "nrftlpath",
-            "pwadpath", "savepath", "demopath", "conf"
+            "pwadpath", "savepath", "demopath", "wadpaths", "conf"
+        )
+        self.int_globals = ("res_x", "res_y", "gl_res_x", "gl_res_y", "archive_cache_mb", "sample_interval_ms")
+        self.bool_globals = (
+            "make_savedirs", "opengl", "fullscreen", "gl_fullscreen", "fsdesktop", "sample_usage", "log_engine_output"
         )
-        self.int_globals = ("res_x", "res_y", "gl_res_x", "gl_res_y")
-        self.bool_globals = ("make_savedirs", "opengl", "fullscreen", "gl_fullscreen", "fsdesktop")
         self.int_custommgr = ("iwad_index", "comp_index", "level_index", "skill_index")
         self.bool_custommgr = ("fast", "respawn", "demorec", "demoplay")
         self.string_custommgr = ("cmdline", "demorec_name", "demoplay_name")
 
-    def save(self, ini_file=None):
+    def fields(self) -> dict:
+        """Return the current settings the way they're written to .ini files: {section: {name: value}}"""
         self.__save_section(Shell, self.SECT_GLOB, self.string_globals, self.int_globals, self.bool_globals)
         self.__save_section(
             self.__custommgr, self.SECT_CUSTM, self.string_custommgr, self.int_custommgr, self.bool_custommgr
         )
         self.__ini[self.SECT_CUSTM]["files"] = ';'.join(self.__custommgr.files)
+        return {section: dict(self.__ini[section]) for section in (self.SECT_GLOB, self.SECT_CUSTM)}
+
+    def __make_dir(self):
+        if not os.path.exists(self.INI_DIR):
+            os.makedirs(self.INI_DIR)
+
+    @tracing.traced("ini save")
+    def save(self, ini_file=None):
+        if library.read_only:
+            return
+        fields = self.fields()
         target = ini_file if bool(ini_file) else self.__default_ini_file
-        with open(target, "w") as saved_ini:
+        self.__make_dir()
+        # write the whole file aside and swap it in, a crash never leaves a half-written .ini
+        temp = target + ".tmp"
+        with open(temp, "w") as saved_ini:
             self.__ini.write(saved_ini)
-
+        os.replace(temp, target)
+        if not bool(ini_file):
+            self.__saved = fields
+            self.__journal_entries = 0
+            if os.path.exists(self.__journal_file):
+                os.remove(self.__journal_file)
+
+    @tracing.traced("ini load")
     def load(self, ini_file=None):
-        ini_loaded = self.__ini.read(ini_file) if bool(ini_file) else self.__ini.read(self.__default_ini_file)
+        # read apart from the settings so far, a key the file doesn't have must not be taken from them
+        ini = cp.ConfigParser()
+        ini_loaded = ini.read(ini_file) if bool(ini_file) else ini.read(self.__default_ini_file)
         if ini_loaded:
-            self.__load_section(Shell, self.SECT_GLOB, self.string_globals, self.int_globals, self.bool_globals)
+            self.__ini.read_dict(ini)
+            self.__load_all(ini, full=True)
+        if not bool(ini_file):
+            self.__saved = self.fields()
+            if self.__replay_journal():
+                self.save()
+
+    def autosave(self):
+        """Append the settings changed since the last write to the journal, which is a lot cheaper
+        than rewriting the whole .ini file, and fold the journal into it once it grows long"""
+        fields = self.fields()
+        changes = {
+            section: {var: value for var, value in values.items() if self.__saved.get(section, {}).get(var) != value}
+            for section, values in fields.items()
+        }
+        changes = {section: values for section, values in changes.items() if bool(values)}
+        if not bool(changes) or library.read_only:
+            return
+        self.__make_dir()
+        with open(self.__journal_file, "a") as journal:
+            journal.write(json.dumps(changes) + "\n")
+            journal.flush()
+            os.fsync(journal.fileno())
+        self.__saved = fields
+        self.__journal_entries += 1
+        if self.__journal_entries >= self.JOURNAL_COMPACT:
+            self.save()
+
+    def __replay_journal(self) -> bool:
+        """Apply the changes journaled after the last save, returns whether there were any"""
+        try:
+            with open(self.__journal_file) as journal:
+                lines = journal.readlines()
+        except OSError:
+            return False
+        for line in lines:
+            try:
+                self.apply_fields(json.loads(line))
+            except (ValueError, AttributeError):
+                break   # the last entry may be cut short by a crash
+        return bool(lines)
+
+    def apply_fields(self, fields: dict):
+        """Apply settings given in the .ini format, only the ones that differ from the current state are set"""
+        current = self.fields()
+        changes = cp.ConfigParser()
+        changes.read_dict({
+            section: {var: value for var, value in values.items() if current[section].get(var) != value}
+            for section, values in fields.items() if section in current
+        })
+        self.__ini.read_dict(changes)
+        self.__load_all(changes)
+
+    def __load_all(self, ini: cp.ConfigParser, full=False):
+        """Set the settings the ini has. A full .ini file without files means an empty load order,
+        a set of changes without them leaves the load order alone"""
+        if ini.has_section(self.SECT_GLOB):
+            self.__load_section(ini, Shell, self.SECT_GLOB, self.string_globals, self.int_globals, self.bool_globals)
+        if ini.has_section(self.SECT_CUSTM):
             self.__load_section(
-                self.__custommgr, self.SECT_CUSTM, self.string_custommgr, self.int_custommgr, self.bool_custommgr
+                ini, self.__custommgr, self.SECT_CUSTM,
+                self.string_custommgr, self.int_custommgr, self.bool_custommgr
             )
-            files = self.__ini[self.SECT_CUSTM]["files"] if "files" in self.__ini[self.SECT_CUSTM] else []
-            self.__custommgr.files = files.split(';') if bool(files) else []
+            if "files" in ini[self.SECT_CUSTM]:
+                files = ini[self.SECT_CUSTM]["files"]
+                self.__custommgr.files = files.split(';') if bool(files) else []
+            elif full:
+                self.__custommgr.files = []
 
-    def __load_section(self, obj, section, string_vars=(), int_vars=(), bool_vars=()):
+    def __load_section(self, ini, obj, section, string_vars=(), int_vars=(), bool_vars=()):
         temp = [
-            {var: self.__ini.getint(section, var) for var in int_vars if var in self.__ini[section]},
-            {var: self.__ini.getboolean(section, var) for var in bool_vars if var in self.__ini[section]},
-            {var: self.__ini[section][var] for var in string_vars if var in self.__ini[section]}
+            {var: ini.getint(section, var) for var in int_vars if var in ini[section]},
+            {var: ini.getboolean(section, var) for var in bool_vars if var in ini[section]},
+            {var: ini[section][var] for var in string_vars if var in ini[section]}
         ]
         all_vars = {key: dic[key] for dic in temp for key in dic}
         for var in all_vars:
@@ -0,0 +1,105 @@
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+
+TRACE_ENV = "PRBOOM_LAUNCHER_TRACE"
+
+# perf_counter_ns is new in Python 3.7
+clock_ns = getattr(time, "perf_counter_ns", lambda: int(time.perf_counter() * 1e9))
+
+
+class Span(object):
+    """Times a with-block and records it as one trace event"""
+
+    def __init__(self, tracer, name: str, args: dict):
+        self.__tracer = tracer
+        self.__name = name
+        self.__args = args
+        self.__start = 0
+
+    def __enter__(self):
+        self.__start = clock_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.__tracer.complete(self.__name, self.__start, clock_ns(), **self.__args)
+        return False
+
+
+class NoSpan(object):
+    """Stands in for a Span while tracing is off"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NO_SPAN = NoSpan()
+
+
+class Tracer(object):
+    """Collect timed spans and write them as a Chrome trace_event JSON file, which chrome://tracing
+    and Perfetto open. Tracing is off unless enabled, then span() only returns a shared dummy"""
+
+    def __init__(self):
+        self.enabled = False
+        self.__trace_file = None
+        self.__events = []
+        self.__lock = threading.Lock()
+        self.__origin = clock_ns()
+
+    def enable(self, trace_file: str):
+        if not self.enabled:
+            atexit.register(self.save)
+        self.enabled = True
+        self.__trace_file = trace_file
+
+    def span(self, name: str, **args):
+        return Span(self, name, args) if self.enabled else NO_SPAN
+
+    def complete(self, name: str, start_ns: int, end_ns: int, **args):
+        """Record a span that was timed elsewhere, e.g. started in one thread and finished in another"""
+        if not self.enabled:
+            return
+        event = {
+            "name": name, "cat": "launcher", "ph": "X", "pid": os.getpid(), "tid": threading.get_ident(),
+            "ts": (start_ns - self.__origin) / 1000, "dur": (end_ns - start_ns) / 1000,
+            "args": {key: str(value) for key, value in args.items()}
+        }
+        with self.__lock:
+            self.__events.append(event)
+
+    def save(self):
+        if not self.enabled:
+            return
+        with self.__lock:
+            events = list(self.__events)
+        folder = os.path.dirname(self.__trace_file)
+        if bool(folder) and not os.path.exists(folder):
+            os.makedirs(folder)
+        with open(self.__trace_file + ".tmp", "w") as trace:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, trace)
+        os.replace(self.__trace_file + ".tmp", self.__trace_file)
+
+
+def traced(name: str):
+    """Decorate a function to record every call as a span"""
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return function(*args, **kwargs)
+            with tracer.span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+tracer = Tracer()
+if bool(os.environ.get(TRACE_ENV)):
+    tracer.enable(os.environ[TRACE_ENV])
@@ -0,0 +1,126 @@
+import collections
+import os
+import os.path
+import shutil
+import stat
+import threading
+import time
+
+STAT_TTL = 2.0
+STAT_WORKERS = 8
+# the options followed by paths, -file takes every argument up to the next option
+PATH_OPTIONS = ("-iwad", "-file", "-deh", "-config", "-playdemo", "-timedemo")
+# the engine adds .lmp to demo names given without an extension
+DEMO_OPTIONS = ("-playdemo", "-timedemo")
+# these may be empty, everything else is useless to the engine then
+EMPTY_ALLOWED = ("-config",)
+
+
+class Problem(collections.namedtuple("Problem", ("option", "path", "reason"))):
+    """Something that keeps the engine from starting the session"""
+
+    def __str__(self) -> str:
+        return "{} {}: {}".format(self.option, self.path, self.reason)
+
+
+def referenced_paths(argv: list) -> list:
+    """Return (option, path) of every path the arguments after the executable name refer to"""
+    referenced = []
+    option = None
+    for arg in argv[1:]:
+        if arg.startswith("-"):
+            option = arg if arg in PATH_OPTIONS else None
+        elif option is not None:
+            referenced.append((option, arg))
+            if option != "-file":
+                option = None
+    return referenced
+
+
+def demo_names(path: str) -> list:
+    return [path] if os.path.splitext(path)[1] else [path, path + ".lmp"]
+
+
+class StatCache(object):
+    """os.stat results kept for a few seconds, so the files checked for the game list don't have to be
+    looked up again when the game starts right after. A missing file is cached as None"""
+
+    def __init__(self, ttl=STAT_TTL):
+        self.__ttl = ttl
+        self.__stats = {}
+        self.__lock = threading.Lock()
+
+    def stat(self, path: str):
+        now = time.monotonic()
+        with self.__lock:
+            cached = self.__stats.get(path)
+        if cached is not None and now - cached[0] < self.__ttl:
+            return cached[1]
+        try:
+            result = os.stat(path)
+        except (OSError, ValueError):
+            result = None
+        with self.__lock:
+            self.__stats[path] = (now, result)
+        return result
+
+    def clear(self):
+        with self.__lock:
+            self.__stats.clear()
+
+
+class Validator(object):
+    """Check everything a session refers to before the engine is spawned. The files are looked up
+    all at once on a thread pool, so a slow or sleeping network drive is waited for only once"""
+
+    def __init__(self, cache=None):
+        self.cache = StatCache() if cache is None else cache
+        self.__pool = None
+        self.__pool_lock = threading.Lock()
+
+    def __executor(self):
+        with self.__pool_lock:
+            if self.__pool is None:
+                # loaded with the first pool, importing the module stays cheap
+                import concurrent.futures as cf
+                self.__pool = cf.ThreadPoolExecutor(max_workers=STAT_WORKERS)
+            return self.__pool
+
+    def stat_all(self, paths) -> dict:
+        """Return {path: stat result or None} for the paths"""
+        paths = list(collections.OrderedDict.fromkeys(paths))
+        if len(paths) < 2:
+            return {path: self.cache.stat(path) for path in paths}
+        return dict(zip(paths, self.__executor().map(self.cache.stat, paths)))
+
+    def missing(self, paths) -> list:
+        """Return the paths that aren't existing files"""
+        stats = self.stat_all(paths)
+        return [path for path, result in stats.items() if result is None or not stat.S_ISREG(result.st_mode)]
+
+    def exists(self, path: str) -> bool:
+        return not bool(self.missing([path]))
+
+    def validate(self, argv: list) -> list:
+        """Return a Problem for every path in the argument vector that can't be used, nothing if they all can"""
+        referenced = referenced_paths(argv)
+        stats = self.stat_all(
+            name for option, path in referenced
+            for name in (demo_names(path) if option in DEMO_OPTIONS else [path])
+        )
+        problems = []
+        if shutil.which(argv[0]) is None:
+            problems.append(Problem("executable", argv[0], "not found"))
+        for option, path in referenced:
+            names = demo_names(path) if option in DEMO_OPTIONS else [path]
+            found = [stats[name] for name in names if stats[name] is not None]
+            if not bool(found):
+                problems.append(Problem(option, path, "not found"))
+            elif stat.S_ISDIR(found[0].st_mode):
+                problems.append(Problem(option, path, "is a folder"))
+            elif found[0].st_size == 0 and option not in EMPTY_ALLOWED:
+                problems.append(Problem(option, path, "is empty"))
+        return problems
+
+
+validator = Validator()
@@ -0,0 +1,113 @@
+import collections
+import mmap
+import os.path
+import re
+import struct
+
+import library
+
+HEADER = struct.Struct("<4sii")
+DIR_ENTRY = struct.Struct("<ii8s")
+MAP_CACHE_FILE = library.CACHE_DIR + "/maps.json"
+
+# lumps that follow a map marker in the binary and UDMF map formats
+MAP_DATA_LUMPS = ("THINGS", "TEXTMAP")
+EPISODE_MAP = re.compile(r"^E(\d)M(\d)$")
+DOOM2_MAP = re.compile(r"^MAP(\d\d)$")
+
+Lump = collections.namedtuple("Lump", ("name", "offset", "size"))
+
+
+class WadFile(object):
+    """Read the lump directory of a WAD file through mmap, lump bodies are only
+    touched when read() is called for them"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.__file = open(path, "rb")
+        try:
+            self.__map = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.__file.close()
+            raise ValueError("Empty file: {}".format(path))
+        try:
+            self.kind, self.lumps = self.__read_directory()
+        except (ValueError, struct.error):
+            self.close()
+            raise ValueError("Not a valid WAD file: {}".format(path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.__map.close()
+        self.__file.close()
+
+    def __read_directory(self):
+        kind, numlumps, dir_offset = HEADER.unpack_from(self.__map, 0)
+        if kind not in (b"IWAD", b"PWAD"):
+            raise ValueError(kind)
+        dir_end = dir_offset + numlumps * DIR_ENTRY.size
+        if numlumps < 0 or dir_offset < HEADER.size or dir_end > len(self.__map):
+            raise ValueError(numlumps)
+        lumps = [
+            Lump(name.split(b"\0", 1)[0].decode("ascii", "replace").upper(), offset, size)
+            for offset, size, name in DIR_ENTRY.iter_unpack(self.__map[dir_offset:dir_end])
+        ]
+        return kind.decode("ascii"), lumps
+
+    def read(self, lump: Lump) -> bytes:
+        return self.__map[lump.offset:lump.offset + lump.size]
+
+    def find(self, name: str):
+        """Return the last lump with the given name, which is the one the engine uses"""
+        for lump in reversed(self.lumps):
+            if lump.name == name:
+                return lump
+        return None
+
+    def maps(self) -> list:
+        return map_markers([lump.name for lump in self.lumps])
+
+
+def map_markers(names: list) -> list:
+    """Return the map markers in a list of lump names, normalized to the launcher's map names"""
+    markers = []
+    for i, name in enumerate(names[:-1]):
+        if names[i + 1] not in MAP_DATA_LUMPS:
+            continue
+        episode = EPISODE_MAP.match(name)
+        doom2 = DOOM2_MAP.match(name)
+        if episode:
+            markers.append(name)
+        elif doom2:
+            markers.append("MAP{}".format(int(doom2.group(1))))
+    return markers
+
+
+def read_maps(path: str) -> list:
+    with WadFile(path) as wad:
+        return wad.maps()
+
+
+# the map lists of every WAD we ever looked at, keyed on (path, size, mtime)
+map_cache = library.FileCache(MAP_CACHE_FILE)
+
+
+def pwad_maps(paths: list) -> list:
+    """Return the maps defined by any of the files, skipping the ones that can't be read"""
+    maps = collections.OrderedDict()
+    for path in paths:
+        try:
+            maps.update((name, None) for name in map_cache.get(path, read_maps))
+        except (OSError, ValueError):
+            continue
+    map_cache.save()
+    return list(maps)
+
+
+def is_wad_name(name: str) -> bool:
+    return os.path.splitext(name)[1].lower() == ".wad"
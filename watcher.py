@@ -0,0 +1,296 @@
+import collections
+import ctypes
+import ctypes.util
+import os
+import os.path
+import queue
+import select
+import struct
+import sys
+import threading
+import time
+
+import library
+
+POLL_INTERVAL = 1.0
+SELECT_TIMEOUT = 0.5
+READ_SIZE = 64 * 1024
+
+ADDED = "added"
+REMOVED = "removed"
+RENAMED = "renamed"
+CHANGED = "changed"
+# the watched tree got new or removed folders, the files in them are not reported one by one
+RESCAN = "rescan"
+
+# inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_WATCH_MASK = (
+    IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+)
+INOTIFY_EVENT = struct.Struct("iIII")
+
+Change = collections.namedtuple("Change", ("kind", "name", "new_name"))
+
+
+class Watch(object):
+    """A watched folder. Changes to the files matching the patterns pile up until they're taken,
+    names are relative to the folder like the ones LibraryIndex.walk returns"""
+
+    def __init__(self, folder: str, patterns, recursive: bool, exclude=()):
+        self.folder = folder
+        self.patterns = patterns
+        self.recursive = recursive
+        self.path = os.path.abspath(folder)
+        # subfolders left out of a recursive watch, like LibraryIndex.walk leaves them out
+        self.exclude = [os.path.abspath(path) for path in exclude]
+        self.__changes = queue.Queue()
+
+    def excludes(self, directory: str) -> bool:
+        return any(directory == path or directory.startswith(path + os.sep) for path in self.exclude)
+
+    def covers(self, directory: str) -> bool:
+        if directory == self.path:
+            return True
+        return self.recursive and directory.startswith(self.path + os.sep) and not self.excludes(directory)
+
+    def __relative(self, directory: str, name: str):
+        if name is None or not bool(library.match_patterns([name], self.patterns)):
+            return None
+        return os.path.relpath(os.path.join(directory, name), self.path).replace(os.sep, "/")
+
+    def notify(self, kind: str, directory: str, name=None, new_name=None):
+        """Queue a change in one of the covered directories, dropping files that don't match the patterns"""
+        if kind == RESCAN:
+            self.__changes.put(Change(RESCAN, None, None))
+            return
+        old, new = self.__relative(directory, name), self.__relative(directory, new_name)
+        if kind == RENAMED:
+            # a download renamed from its temporary name only shows up here
+            if old is not None and new is not None:
+                self.__changes.put(Change(RENAMED, old, new))
+            elif old is not None:
+                self.__changes.put(Change(REMOVED, old, None))
+            elif new is not None:
+                self.__changes.put(Change(ADDED, new, None))
+        elif old is not None:
+            self.__changes.put(Change(kind, old, None))
+
+    def changes(self) -> list:
+        """Take the changes queued since the last call, oldest first"""
+        changes = []
+        while True:
+            try:
+                changes.append(self.__changes.get_nowait())
+            except queue.Empty:
+                return changes
+
+
+class FolderWatcher(object):
+    """Watch folders for added, removed, renamed and rewritten files on a background thread.
+    This one polls the modification time of every watched directory and only lists the ones
+    that changed, InotifyWatcher gets the same changes from the kernel"""
+
+    def __init__(self, interval=POLL_INTERVAL):
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._watches = []
+        self._dirty = True
+        self.__thread = None
+
+    def watch(self, folder: str, patterns=library.PWAD_PATTERNS, recursive=False, exclude=()) -> Watch:
+        watch = Watch(folder, patterns, recursive, exclude)
+        with self._lock:
+            self._watches.append(watch)
+            self._dirty = True
+            if self.__thread is None:
+                self.__thread = threading.Thread(target=self._run, daemon=True)
+                self.__thread.start()
+        return watch
+
+    def unwatch(self, watch: Watch):
+        with self._lock:
+            if watch in self._watches:
+                self._watches.remove(watch)
+                self._dirty = True
+
+    def _take_dirty(self) -> bool:
+        with self._lock:
+            dirty, self._dirty = self._dirty, False
+            return dirty
+
+    def _directories(self) -> set:
+        """Every directory some watch covers"""
+        with self._lock:
+            watches = list(self._watches)
+        directories = set()
+        for watch in watches:
+            if not os.path.isdir(watch.path):
+                continue
+            directories.add(watch.path)
+            if watch.recursive:
+                for parent, dirs, files in os.walk(watch.path):
+                    dirs[:] = [name for name in dirs if not watch.excludes(os.path.join(parent, name))]
+                    directories.add(parent)
+        return directories
+
+    def _dispatch(self, kind: str, directory=None, name=None, new_name=None):
+        """Pass a change to the watches covering the directory, a change without one goes to every watch"""
+        with self._lock:
+            watches = list(self._watches)
+        for watch in watches:
+            if directory is None or watch.covers(directory):
+                watch.notify(kind, directory, name, new_name)
+
+    @staticmethod
+    def __snapshot(directory: str):
+        with os.scandir(directory) as entries:
+            return {entry.name: (entry.inode(), entry.is_dir()) for entry in entries}
+
+    def __diff(self, directory: str, old: dict, new: dict):
+        removed = {name: old[name] for name in old if name not in new}
+        added = {name: new[name] for name in new if name not in old}
+        if any(is_dir for inode, is_dir in list(removed.values()) + list(added.values())):
+            self._dispatch(RESCAN, directory)
+            with self._lock:
+                self._dirty = True
+        inodes = {inode: name for name, (inode, is_dir) in added.items() if not is_dir}
+        for name, (inode, is_dir) in removed.items():
+            if is_dir:
+                continue
+            if inode in inodes:
+                self._dispatch(RENAMED, directory, name, inodes.pop(inode))
+            else:
+                self._dispatch(REMOVED, directory, name)
+        for name in inodes.values():
+            self._dispatch(ADDED, directory, name)
+
+    def _run(self):
+        snapshots = {}
+        directories = set()
+        while True:
+            if self._take_dirty():
+                directories = self._directories()
+                snapshots = {directory: snapshots[directory] for directory in snapshots if directory in directories}
+            for directory in directories:
+                try:
+                    mtime = os.stat(directory).st_mtime_ns
+                    old = snapshots.get(directory)
+                    if old is not None and old[0] == mtime:
+                        continue
+                    snapshots[directory] = mtime, self.__snapshot(directory)
+                except OSError:
+                    continue
+                if old is not None:
+                    self.__diff(directory, old[1], snapshots[directory][1])
+            time.sleep(self._interval)
+
+
+class InotifyWatcher(FolderWatcher):
+    """FolderWatcher getting the changes from Linux inotify through ctypes, nothing is polled.
+    Falls back to polling if the kernel refuses to set up inotify"""
+
+    def __init__(self, libc, interval=POLL_INTERVAL):
+        super().__init__(interval)
+        self.__libc = libc
+        self.__descriptors = {}
+
+    def __update_watches(self, fd: int):
+        directories = self._directories()
+        for wd, directory in list(self.__descriptors.items()):
+            if directory not in directories:
+                self.__libc.inotify_rm_watch(fd, wd)
+                del self.__descriptors[wd]
+        watched = set(self.__descriptors.values())
+        for directory in directories - watched:
+            wd = self.__libc.inotify_add_watch(fd, os.fsencode(directory), IN_WATCH_MASK)
+            if wd < 0:
+                print("Can't watch {}: {}".format(directory, os.strerror(ctypes.get_errno())))
+            else:
+                self.__descriptors[wd] = directory
+
+    def __read_events(self, fd: int):
+        try:
+            data = os.read(fd, READ_SIZE)
+        except BlockingIOError:
+            return
+        moves = collections.OrderedDict()
+        offset = 0
+        while offset + INOTIFY_EVENT.size <= len(data):
+            wd, mask, cookie, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            directory = self.__descriptors.get(wd)
+            if mask & IN_Q_OVERFLOW:
+                # events were lost, everybody has to look again
+                self._dispatch(RESCAN)
+            elif mask & IN_IGNORED:
+                self.__descriptors.pop(wd, None)
+            elif directory is None:
+                continue
+            elif mask & (IN_ISDIR | IN_DELETE_SELF | IN_MOVE_SELF):
+                self._dispatch(RESCAN, directory)
+                with self._lock:
+                    self._dirty = True
+            elif mask & IN_MOVED_FROM:
+                moves[cookie] = directory, name
+            elif mask & IN_MOVED_TO:
+                source = moves.pop(cookie, None)
+                if source is None:
+                    self._dispatch(ADDED, directory, name)
+                elif source[0] == directory:
+                    self._dispatch(RENAMED, directory, source[1], name)
+                else:
+                    self._dispatch(REMOVED, *source)
+                    self._dispatch(ADDED, directory, name)
+            elif mask & IN_CREATE:
+                self._dispatch(ADDED, directory, name)
+            elif mask & IN_DELETE:
+                self._dispatch(REMOVED, directory, name)
+            elif mask & IN_CLOSE_WRITE:
+                self._dispatch(CHANGED, directory, name)
+        # moved out of the watched folders
+        for directory, name in moves.values():
+            self._dispatch(REMOVED, directory, name)
+
+    def _run(self):
+        fd = self.__libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            print("inotify is unavailable: {}, polling instead".format(os.strerror(ctypes.get_errno())))
+            return super()._run()
+        while True:
+            if self._take_dirty():
+                self.__update_watches(fd)
+            ready, _, _ = select.select([fd], [], [], SELECT_TIMEOUT)
+            if bool(ready):
+                self.__read_events(fd)
+
+
+def inotify_libc():
+    """Return the C library if it has inotify, None elsewhere"""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    except OSError:
+        return None
+    return libc if hasattr(libc, "inotify_init1") else None
+
+
+def create_watcher(interval=POLL_INTERVAL) -> FolderWatcher:
+    libc = inotify_libc()
+    return InotifyWatcher(libc, interval) if libc is not None else FolderWatcher(interval)
+
+
+# the thread only starts with the first watched folder
+folders = create_watcher()